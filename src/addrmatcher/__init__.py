@@ -1,4 +1,40 @@
-from .matcher import GeoMatcher, DistanceMethod
 from .region import Region
-from .resource import download
+from .cache import CoordinateCache
+from .stats import StageStats
+from .scheduler import MatchScheduler
 from .hierarchies.AUS import AUS
+
+# the modules importing pandas, pyarrow, scikit-learn, etc. are imported
+# on the first use of their names, so that importing the package is fast
+_LAZY_NAMES = {
+    "GeoMatcher": "matcher",
+    "DistanceMethod": "matcher",
+    "SearchMode": "matcher",
+    "download": "resource",
+}
+
+__all__ = [
+    "GeoMatcher",
+    "DistanceMethod",
+    "SearchMode",
+    "Region",
+    "CoordinateCache",
+    "StageStats",
+    "MatchScheduler",
+    "download",
+    "AUS",
+]
+
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        import importlib
+
+        value = getattr(importlib.import_module(f".{_LAZY_NAMES[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
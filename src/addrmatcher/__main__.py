@@ -1,4 +1,4 @@
-from .resource import main
+from .resource import download as main
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,1401 @@
+"""
+Build the reference dataset of Australia from the G-NAF release (psv files)
+and the ABS ASGS 2016 release (csv files)
+
+Usage: addrmatcher-build --source [folder of the release files] --output data/Australia
+
+The source folder holds, for each state:
+    [STATE]_ADDRESS_DETAIL_psv.psv, [STATE]_ADDRESS_DEFAULT_GEOCODE_psv.psv,
+    [STATE]_STREET_LOCALITY_psv.psv, [STATE]_LOCALITY_psv.psv,
+    [STATE]_ADDRESS_MESH_BLOCK_2016_psv.psv, LGA_2016_[STATE].csv,
+    MB_2016_[STATE].csv
+and the suburbs of all the states, SSC_2016_AUST.csv.
+
+The states are built in parallel, by a pool of processes. Each state owns
+a block of IDX values (IDX_BLOCK), so that the IDX of a street doesn't
+depend on the other states.
+
+With a memory limit (--memory-limit), the G-NAF files are read in blocks
+and joined in parts spilled to disk, so that large states (e.g. NSW) can be
+built on a small machine. The peak memory (RSS) is reported at the end.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import glob
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from . import dataset
+from .hierarchies.AUS import AUS
+
+try:
+    import resource
+except ImportError:
+    # the resource module isn't available on Windows
+    resource = None
+
+STATES = ["ACT", "NSW", "NT", "OT", "QLD", "SA", "TAS", "VIC", "WA"]
+
+# the maximum number of addresses in an address file (a street is never split)
+MAX_ROWS = 500000
+
+# the IDX values of the streets of a state start at (position + 1) * IDX_BLOCK
+IDX_BLOCK = 10000000
+
+# the number of rows of the row groups of the address files
+ROW_GROUP_SIZE = 65536
+
+# the mean radius of the earth (km), used by the cartesian coordinates
+EARTH_RADIUS = 6371
+
+# the columns identifying a street, i.e. a row of the index file
+STREET_COLUMNS = [
+    "STREET_NAME",
+    "STREET_TYPE_CODE",
+    "LOCALITY_NAME",
+    "STATE",
+    "POSTCODE",
+]
+
+# the components of the full address, in order
+ADDRESS_COMPONENTS = [
+    "LOT_NUMBER_PREFIX",
+    "LOT_NUMBER",
+    "LOT_NUMBER_SUFFIX",
+    "FLAT_TYPE_CODE",
+    "FLAT_NUMBER_PREFIX",
+    "FLAT_NUMBER",
+    "FLAT_NUMBER_SUFFIX",
+    "LEVEL_TYPE_CODE",
+    "LEVEL_NUMBER_PREFIX",
+    "LEVEL_NUMBER",
+    "LEVEL_NUMBER_SUFFIX",
+    "NUMBER_FIRST_PREFIX",
+    "NUMBER_FIRST",
+    "NUMBER_FIRST_SUFFIX",
+    "NUMBER_LAST_PREFIX",
+    "NUMBER_LAST",
+    "NUMBER_LAST_SUFFIX",
+] + STREET_COLUMNS
+
+# the columns read from the G-NAF files, by the name of the file
+GNAF_COLUMNS = {
+    "ADDRESS_DETAIL": [
+        "ADDRESS_DETAIL_PID",
+        "STREET_LOCALITY_PID",
+        "LOCALITY_PID",
+        "POSTCODE",
+    ]
+    + [column for column in ADDRESS_COMPONENTS if column not in STREET_COLUMNS],
+    "ADDRESS_MESH_BLOCK_2016": ["ADDRESS_DETAIL_PID", "MB_2016_PID"],
+    "ADDRESS_DEFAULT_GEOCODE": ["ADDRESS_DETAIL_PID", "LONGITUDE", "LATITUDE"],
+    "STREET_LOCALITY": ["STREET_LOCALITY_PID", "STREET_NAME", "STREET_TYPE_CODE"],
+    "LOCALITY": ["LOCALITY_PID", "LOCALITY_NAME"],
+}
+
+# the G-NAF files with one row per address, in the order of join_addresses
+ADDRESS_FILES = ["ADDRESS_DETAIL", "ADDRESS_MESH_BLOCK_2016", "ADDRESS_DEFAULT_GEOCODE"]
+
+# the estimated ratio of the memory used by the joined addresses
+# to the size of the G-NAF files, used by the streaming build
+MEMORY_RATIO = 12
+
+# the region columns of the ASGS files stored with the addresses
+REGION_COLUMNS = [
+    "LGA_NAME_2016",
+    "SSC_NAME_2016",
+    "SA4_NAME_2016",
+    "SA3_NAME_2016",
+    "SA2_NAME_2016",
+    "SA1_7DIGITCODE_2016",
+    "MB_CODE_2016",
+]
+
+# the columns of the address files
+ADDRESS_COLUMNS = (
+    [
+        "IDX",
+        "ADDRESS_DETAIL_PID",
+        "STREET_LOCALITY_PID",
+        "FULL_ADDRESS",
+        "LATITUDE",
+        "LONGITUDE",
+    ]
+    + REGION_COLUMNS
+    + STREET_COLUMNS
+    + ["CARTESIAN_COOR", "FILE_NAME"]
+)
+
+# the schema of the address files, the columns are strings except
+ADDRESS_TYPES = {"IDX": pa.int64(), "LATITUDE": pa.float64(), "LONGITUDE": pa.float64()}
+ADDRESS_SCHEMA = pa.schema(
+    [(column, ADDRESS_TYPES.get(column, pa.string())) for column in ADDRESS_COLUMNS]
+)
+
+# the columns compared to find the streets changed by a new release
+HASH_COLUMNS = [
+    column for column in ADDRESS_COLUMNS if column not in ("IDX", "FILE_NAME")
+]
+
+# the columns of the index file, before the street centroids are added
+INDEX_COLUMNS = (
+    ["IDX"]
+    + STREET_COLUMNS
+    + [
+        "FILE_NAME",
+        "ADDRESS_COUNT",
+        "MIN_STREET_NUMBER",
+        "MAX_STREET_NUMBER",
+        "ADDRESS",
+    ]
+)
+
+
+def _csv_options(columns, delimiter):
+    """
+    Return the parse and convert options reading the columns as strings,
+    the empty values as missing values (null)
+    """
+    return (
+        csv.ParseOptions(delimiter=delimiter),
+        csv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.string() for column in columns},
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def read_table(filename, columns, delimiter=","):
+    """
+    Read the columns of a release file, as strings.
+    The empty values are read as missing values (null)
+
+    Parameters
+    ----------
+    filename:string
+        The path of the psv or csv file
+    columns:list
+        The columns to be read
+    delimiter:string
+        The delimiter of the values, "|" for the G-NAF files
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    parse_options, convert_options = _csv_options(columns, delimiter)
+    table = csv.read_csv(
+        filename, parse_options=parse_options, convert_options=convert_options
+    )
+    return table.to_pandas()
+
+
+def gnaf_filename(source, state, name):
+    """
+    Return the path of a G-NAF file of the state, e.g. NSW_LOCALITY_psv.psv
+    """
+    return os.path.join(source, f"{state}_{name}_psv.psv")
+
+
+def read_lookups(source, state, suburbs):
+    """
+    Read the tables joined to the addresses of a state: the streets,
+    the localities and the regions of the meshblocks
+
+    Parameters
+    ----------
+    source:string
+        The folder of the release files
+    state:string
+        The state, e.g. NSW
+    suburbs:pandas.DataFrame
+        The suburbs of the meshblocks (SSC_2016_AUST.csv)
+
+    Returns
+    -------
+    dictionary
+        The tables, by the name of the G-NAF file, and ASGS for the regions
+    """
+    lookups = {
+        name: read_table(
+            gnaf_filename(source, state, name), GNAF_COLUMNS[name], delimiter="|"
+        )
+        for name in ["STREET_LOCALITY", "LOCALITY"]
+    }
+
+    meshblock_regions = read_table(
+        os.path.join(source, f"MB_2016_{state}.csv"),
+        [
+            "MB_CODE_2016",
+            "SA1_7DIGITCODE_2016",
+            "SA2_NAME_2016",
+            "SA3_NAME_2016",
+            "SA4_NAME_2016",
+        ],
+    )
+    lgas = read_table(
+        os.path.join(source, f"LGA_2016_{state}.csv"), ["MB_CODE_2016", "LGA_NAME_2016"]
+    )
+    lookups["ASGS"] = meshblock_regions.merge(
+        lgas, how="inner", on="MB_CODE_2016"
+    ).merge(suburbs, how="inner", on="MB_CODE_2016")[REGION_COLUMNS]
+
+    return lookups
+
+
+def join_addresses(details, meshblocks, geocodes, lookups, state):
+    """
+    Join the addresses with their street, locality, coordinates and regions,
+    and add their full address and cartesian coordinates.
+    The addresses missing one of them are left out
+
+    Parameters
+    ----------
+    details:pandas.DataFrame
+        The rows of the ADDRESS_DETAIL file
+    meshblocks:pandas.DataFrame
+        The rows of the ADDRESS_MESH_BLOCK_2016 file
+    geocodes:pandas.DataFrame
+        The rows of the ADDRESS_DEFAULT_GEOCODE file
+    lookups:dictionary
+        The tables returned by read_lookups
+    state:string
+        The state, e.g. NSW
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    # the other territories don't have a state in the full address
+    details = details.assign(STATE=state if state != "OT" else "")
+    meshblocks = meshblocks.assign(MB_CODE_2016=meshblocks["MB_2016_PID"].str[4:])
+
+    addresses = (
+        details.merge(lookups["STREET_LOCALITY"], how="inner", on="STREET_LOCALITY_PID")
+        .merge(lookups["LOCALITY"], how="inner", on="LOCALITY_PID")
+        .merge(
+            meshblocks[["ADDRESS_DETAIL_PID", "MB_CODE_2016"]],
+            how="inner",
+            on="ADDRESS_DETAIL_PID",
+        )
+        .merge(geocodes, how="inner", on="ADDRESS_DETAIL_PID")
+        .merge(lookups["ASGS"], how="inner", on="MB_CODE_2016")
+    )
+    addresses["LATITUDE"] = addresses["LATITUDE"].astype(float)
+    addresses["LONGITUDE"] = addresses["LONGITUDE"].astype(float)
+    addresses["FULL_ADDRESS"] = full_address(addresses)
+    addresses["CARTESIAN_COOR"] = cartesian_coordinates(
+        addresses["LATITUDE"], addresses["LONGITUDE"]
+    )
+
+    return addresses
+
+
+def read_addresses(source, state, suburbs):
+    """
+    Read the addresses of a state, see join_addresses
+
+    Parameters
+    ----------
+    source:string
+        The folder of the release files
+    state:string
+        The state, e.g. NSW
+    suburbs:pandas.DataFrame
+        The suburbs of the meshblocks (SSC_2016_AUST.csv)
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    tables = [
+        read_table(
+            gnaf_filename(source, state, name), GNAF_COLUMNS[name], delimiter="|"
+        )
+        for name in ADDRESS_FILES
+    ]
+    return join_addresses(*tables, read_lookups(source, state, suburbs), state)
+
+
+def full_address(addresses):
+    """
+    Return the full addresses, i.e. the address components separated by
+    a single space
+
+    Parameters
+    ----------
+    addresses:pandas.DataFrame
+        The addresses, with the ADDRESS_COMPONENTS columns
+
+    Returns
+    -------
+    pandas.Series
+    """
+    components = addresses[ADDRESS_COMPONENTS].fillna("")
+    return (
+        components[ADDRESS_COMPONENTS[0]]
+        .str.cat([components[column] for column in ADDRESS_COMPONENTS[1:]], sep=" ")
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def cartesian_coordinates(latitudes, longitudes):
+    """
+    Return the cartesian coordinates (x, y, z) of the points as strings,
+    relative to the centre of the earth
+
+    Parameters
+    ----------
+    latitudes:pandas.Series
+        The latitudes of the points, in degrees
+    longitudes:pandas.Series
+        The longitudes of the points, in degrees
+
+    Returns
+    -------
+    pandas.Series
+        The coordinates, e.g. "(-4646.37, 2553.80, -3539.44)"
+    """
+    index = latitudes.index
+    latitudes = np.radians(latitudes.to_numpy(dtype=float))
+    longitudes = np.radians(longitudes.to_numpy(dtype=float))
+
+    def to_string(values):
+        return pd.Series(values, index=index).astype(str)
+
+    x = to_string(EARTH_RADIUS * np.cos(latitudes) * np.cos(longitudes))
+    y = to_string(EARTH_RADIUS * np.cos(latitudes) * np.sin(longitudes))
+    z = to_string(EARTH_RADIUS * np.sin(latitudes))
+    return "(" + x + ", " + y + ", " + z + ")"
+
+
+def count_streets(addresses):
+    """
+    Count the addresses of each street, i.e. each unique combination of
+    the street name, locality, state and postcode, and get their minimum and
+    maximum street numbers. The counts of several parts of the addresses
+    of a state can be combined by index_streets
+
+    Parameters
+    ----------
+    addresses:pandas.DataFrame
+        The addresses (or a part of the addresses) of a state
+
+    Returns
+    -------
+    pandas.DataFrame
+        The street columns, ADDRESS_COUNT, MIN_STREET_NUMBER and
+        MAX_STREET_NUMBER (as numbers)
+    """
+    numbers = (
+        addresses["NUMBER_FIRST"].str.extract(r"(\d+)", expand=False).astype(float)
+    )
+    return (
+        numbers.groupby([addresses[column] for column in STREET_COLUMNS])
+        .agg(["size", "min", "max"])
+        .rename(
+            columns={
+                "size": "ADDRESS_COUNT",
+                "min": "MIN_STREET_NUMBER",
+                "max": "MAX_STREET_NUMBER",
+            }
+        )
+        .reset_index()
+    )
+
+
+def index_streets(counts, position):
+    """
+    Return the index of the streets of a state, from the street with the
+    most addresses to the street with the fewest (then by the street columns)
+
+    Parameters
+    ----------
+    counts:pandas.DataFrame
+        The counts of the streets, returned by count_streets.
+        The counts of the same street are added up
+    position:int
+        The position of the state, the IDX values start at (position + 1) * IDX_BLOCK
+
+    Returns
+    -------
+    pandas.DataFrame
+        The IDX, the street columns, the number of addresses and
+        the minimum and maximum street numbers of the streets
+    """
+    streets = (
+        counts.groupby(STREET_COLUMNS)
+        .agg(
+            ADDRESS_COUNT=("ADDRESS_COUNT", "sum"),
+            MIN_STREET_NUMBER=("MIN_STREET_NUMBER", "min"),
+            MAX_STREET_NUMBER=("MAX_STREET_NUMBER", "max"),
+        )
+        .sort_values("ADDRESS_COUNT", ascending=False, kind="stable")
+        .reset_index()
+    )
+
+    # the street numbers are stored as strings, e.g. "12"
+    for column in ["MIN_STREET_NUMBER", "MAX_STREET_NUMBER"]:
+        strings = streets[column].dropna().astype(np.int64).astype(str)
+        streets[column] = strings.reindex(streets.index)
+
+    streets.insert(
+        0, "IDX", np.arange(1, len(streets) + 1) + (position + 1) * IDX_BLOCK
+    )
+    return streets
+
+
+def assign_files(counts, state, max_rows=MAX_ROWS, number=1, rows=0):
+    """
+    Assign the streets to the address files, in order: a new file is started
+    when the addresses of the street don't fit in the current file
+
+    Parameters
+    ----------
+    counts:array
+        The number of addresses of the streets
+    state:string
+        The state, e.g. NSW
+    max_rows:int
+        The maximum number of addresses in a file
+    number:int
+        The number of the first file, e.g. 1 for NSW-1.parquet
+    rows:int
+        The number of addresses already in the first file
+
+    Returns
+    -------
+    list
+        The file name of each street, e.g. NSW-1.parquet
+    """
+    numbers = []
+    for count in counts.tolist():
+        if rows + count > max_rows and rows > 0:
+            number, rows = number + 1, 0
+        numbers.append(number)
+        rows += count
+    return [f"{state}-{number}.parquet" for number in numbers]
+
+
+def address_table(addresses):
+    """
+    Convert the addresses into an Arrow table of the address files,
+    sorted by IDX (then by ADDRESS_DETAIL_PID) so that the addresses of
+    a street are stored together
+
+    Parameters
+    ----------
+    addresses:pandas.DataFrame
+        The addresses, with the IDX and FILE_NAME of their street
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    addresses = addresses.sort_values(["IDX", "ADDRESS_DETAIL_PID"], kind="stable")
+    return pa.Table.from_pandas(
+        addresses[ADDRESS_COLUMNS], schema=ADDRESS_SCHEMA, preserve_index=False
+    )
+
+
+def remove_address_files(output, state):
+    """
+    Remove the address files of a previous build of the state, e.g. NSW-1.parquet
+    """
+    for filename in glob.glob(os.path.join(output, f"{state}-*.parquet")):
+        if _file_number(os.path.basename(filename), state) is not None:
+            os.remove(filename)
+
+
+def _file_number(file_name, state):
+    """
+    Return the number of the address file of the state, e.g. 2 for
+    NSW-2.parquet, or None if the file isn't an address file of the state
+    """
+    number = file_name[len(state) + 1 : -len(".parquet")]
+    if file_name.startswith(f"{state}-") and number.isdigit():
+        return int(number)
+    return None
+
+
+def _is_state_file(file_names, state):
+    """
+    Return whether the files are address files of the state (numpy array)
+    """
+    return np.array(
+        [_file_number(file_name, state) is not None for file_name in file_names],
+        dtype=bool,
+    )
+
+
+def write_address_files(output, table):
+    """
+    Write the addresses into their address files (FILE_NAME).
+    The addresses of a file must be contiguous, see address_table
+    """
+    for file_name, addresses in _split_by_file(table):
+        pq.write_table(
+            addresses, os.path.join(output, file_name), row_group_size=ROW_GROUP_SIZE
+        )
+
+
+def build_state(source, output, state, position, max_rows=MAX_ROWS, memory_limit=None):
+    """
+    Build the address files of a state
+
+    The addresses of a file are sorted by IDX, so that the addresses of
+    a street are stored together.
+
+    Parameters
+    ----------
+    source:string
+        The folder of the release files
+    output:string
+        The folder of the dataset
+    state:string
+        The state, e.g. NSW
+    position:int
+        The position of the state within STATES
+    max_rows:int
+        The maximum number of addresses in an address file
+    memory_limit:float
+        The approximate memory ceiling (MB) of the build of the state.
+        If it's empty (None), the files are read and joined in memory,
+        otherwise see build_state_streaming
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows of the index file of the state
+    """
+    suburbs = read_table(
+        os.path.join(source, "SSC_2016_AUST.csv"), ["MB_CODE_2016", "SSC_NAME_2016"]
+    )
+    if memory_limit is not None:
+        return build_state_streaming(
+            source, output, state, position, suburbs, max_rows, memory_limit
+        )
+
+    addresses = read_addresses(source, state, suburbs)
+
+    streets = index_streets(count_streets(addresses), position)
+    streets["FILE_NAME"] = assign_files(
+        streets["ADDRESS_COUNT"].to_numpy(), state, max_rows
+    )
+
+    table = address_table(
+        addresses.merge(
+            streets[["IDX", "FILE_NAME"] + STREET_COLUMNS],
+            how="inner",
+            on=STREET_COLUMNS,
+        )
+    )
+    remove_address_files(output, state)
+    write_address_files(output, table)
+
+    return streets
+
+
+def build_state_streaming(
+    source, output, state, position, suburbs, max_rows, memory_limit
+):
+    """
+    Build the address files of a state in parts, keeping the memory used
+    below the ceiling (approximately)
+
+    The G-NAF files with one row per address are read in blocks and split
+    into partitions by the hash of ADDRESS_DETAIL_PID (spilled to disk), so
+    that each partition can be joined in memory. The joined addresses are
+    then split by their address file, and each file is sorted and written.
+    The memory needed to write a file isn't limited by the ceiling but by
+    max_rows (about 1 KB per address).
+
+    The address files are the same as the files built in memory.
+
+    Parameters
+    ----------
+    source:string
+        The folder of the release files
+    output:string
+        The folder of the dataset, the partitions are spilled into
+        a temporary folder within it
+    state:string
+        The state, e.g. NSW
+    position:int
+        The position of the state within STATES
+    suburbs:pandas.DataFrame
+        The suburbs of the meshblocks (SSC_2016_AUST.csv)
+    max_rows:int
+        The maximum number of addresses in an address file
+    memory_limit:float
+        The approximate memory ceiling (MB)
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows of the index file of the state
+    """
+    lookups = read_lookups(source, state, suburbs)
+
+    # the memory left for the addresses, after the libraries and the lookups
+    memory_limit = memory_limit * 2 ** 20
+    memory = peak_memory()
+    available = max(
+        memory_limit - (memory[0] * 2 ** 20 if memory is not None else 0),
+        memory_limit / 4,
+    )
+    size = sum(
+        os.path.getsize(gnaf_filename(source, state, name)) for name in ADDRESS_FILES
+    )
+    partitions = max(1, math.ceil(size * MEMORY_RATIO / available))
+    # the csv reader keeps several blocks in memory (read ahead)
+    block_size = int(min(max(available // 256, 2 ** 20), 2 ** 24))
+    spill = tempfile.mkdtemp(prefix=f".build-{state}-", dir=output)
+    try:
+        # split the G-NAF files by the hash of ADDRESS_DETAIL_PID
+        for name in ADDRESS_FILES:
+            _partition_file(
+                gnaf_filename(source, state, name),
+                GNAF_COLUMNS[name],
+                [
+                    os.path.join(spill, f"{name}-{part}.arrow")
+                    for part in range(partitions)
+                ],
+                block_size,
+            )
+
+        # join the partitions and count the addresses of the streets
+        counts = []
+        for part in range(partitions):
+            filenames = [
+                os.path.join(spill, f"{name}-{part}.arrow") for name in ADDRESS_FILES
+            ]
+            addresses = join_addresses(
+                *[_read_arrow(filename).to_pandas() for filename in filenames],
+                lookups,
+                state,
+            )
+            counts.append(count_streets(addresses))
+            _write_arrow(
+                os.path.join(spill, f"joined-{part}.arrow"),
+                pa.Table.from_pandas(
+                    addresses.assign(IDX=0, FILE_NAME=""),
+                    schema=ADDRESS_SCHEMA,
+                    preserve_index=False,
+                ),
+            )
+            for filename in filenames:
+                os.remove(filename)
+            del addresses
+
+        streets = index_streets(pd.concat(counts, ignore_index=True), position)
+        streets["FILE_NAME"] = assign_files(
+            streets["ADDRESS_COUNT"].to_numpy(), state, max_rows
+        )
+
+        # split the joined addresses by their address file
+        writers = {}
+        try:
+            for part in range(partitions):
+                filename = os.path.join(spill, f"joined-{part}.arrow")
+                addresses = (
+                    _read_arrow(filename)
+                    .to_pandas()
+                    .drop(columns=["IDX", "FILE_NAME"])
+                    .merge(
+                        streets[["IDX", "FILE_NAME"] + STREET_COLUMNS],
+                        how="inner",
+                        on=STREET_COLUMNS,
+                    )
+                )
+                table = pa.Table.from_pandas(
+                    addresses.sort_values("FILE_NAME", kind="stable"),
+                    schema=ADDRESS_SCHEMA,
+                    preserve_index=False,
+                )
+                for file_name, group in _split_by_file(table):
+                    if file_name not in writers:
+                        writers[file_name] = pa.ipc.new_stream(
+                            os.path.join(spill, file_name + ".arrow"), ADDRESS_SCHEMA
+                        )
+                    writers[file_name].write_table(group)
+                os.remove(filename)
+                del addresses, table
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        # sort and write the address files, one at a time
+        remove_address_files(output, state)
+        for file_name in writers:
+            _write_sorted(
+                os.path.join(output, file_name),
+                _read_arrow(os.path.join(spill, file_name + ".arrow")),
+            )
+    finally:
+        shutil.rmtree(spill, ignore_errors=True)
+
+    return streets
+
+
+def _partition_file(filename, columns, partitions, block_size):
+    """
+    Split the rows of a G-NAF file into the partition files (Arrow IPC
+    streams) by the hash of ADDRESS_DETAIL_PID, reading a block at a time
+    """
+    parse_options, convert_options = _csv_options(columns, "|")
+    reader = csv.open_csv(
+        filename,
+        read_options=csv.ReadOptions(block_size=block_size),
+        parse_options=parse_options,
+        convert_options=convert_options,
+    )
+    writers = [pa.ipc.new_stream(partition, reader.schema) for partition in partitions]
+    try:
+        for batch in reader:
+            keys = pd.util.hash_array(
+                batch.column(columns.index("ADDRESS_DETAIL_PID")).to_numpy(
+                    zero_copy_only=False
+                )
+            ) % np.uint64(len(partitions))
+            order = np.argsort(keys, kind="stable")
+            batch = batch.take(pa.array(order))
+            bounds = np.searchsorted(keys[order], np.arange(len(partitions) + 1))
+            for part, writer in enumerate(writers):
+                if bounds[part + 1] > bounds[part]:
+                    writer.write_batch(
+                        batch.slice(bounds[part], bounds[part + 1] - bounds[part])
+                    )
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def _write_sorted(filename, table):
+    """
+    Write the addresses into the address file sorted by IDX (then by
+    ADDRESS_DETAIL_PID) as address_table does, a row group at a time
+    """
+    indices = pc.sort_indices(
+        table, sort_keys=[("IDX", "ascending"), ("ADDRESS_DETAIL_PID", "ascending")]
+    )
+    with pq.ParquetWriter(filename, table.schema) as writer:
+        for start in range(0, len(indices), ROW_GROUP_SIZE):
+            writer.write_table(table.take(indices[start : start + ROW_GROUP_SIZE]))
+
+
+def _split_by_file(table):
+    """
+    Yield the file name and the rows of each address file, the rows of
+    a file must be contiguous
+    """
+    names = table.column("FILE_NAME").to_numpy(zero_copy_only=False)
+    boundaries = np.flatnonzero(names[1:] != names[:-1]) + 1
+    for start, end in zip(
+        np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(names)]])
+    ):
+        yield names[start], table.slice(start, end - start)
+
+
+def _write_arrow(filename, table):
+    """Write the table into an Arrow IPC stream file"""
+    with pa.ipc.new_stream(filename, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow(filename):
+    """Read the table of an Arrow IPC stream file"""
+    with pa.memory_map(filename) as source:
+        return pa.ipc.open_stream(source).read_all()
+
+
+def update_state(source, output, state, position, max_rows=MAX_ROWS, memory_limit=None):
+    """
+    Update the address files of a state from a new release
+
+    The state is built into a temporary folder, then the addresses of each
+    street are compared with the addresses of the previous build. Only
+    the address files holding a new, changed or removed street are
+    rewritten. The streets keep their IDX and their address file, the new
+    streets get the next IDX values of the state and are added to the last
+    address file of the state (or to new files). A file can exceed max_rows
+    when its streets grow, until the next full build.
+
+    The files are written with the region columns, even if the dataset is
+    normalized (see update_dataset).
+
+    Parameters
+    ----------
+    source:string
+        The folder of the release files
+    output:string
+        The folder of the dataset
+    state:string
+        The state, e.g. NSW
+    position:int
+        The position of the state within STATES
+    max_rows:int
+        The maximum number of addresses in an address file
+    memory_limit:float
+        The approximate memory ceiling (MB) of the build of the state,
+        see build_state
+
+    Returns
+    -------
+    tuple
+        The rows of the index file of the state (pandas.DataFrame),
+        the rewritten address files (list) and the number of new, changed
+        and removed streets (dictionary)
+    """
+    previous = pd.read_parquet(
+        os.path.join(output, dataset.INDEX_FILE),
+        columns=["IDX", "FILE_NAME"] + STREET_COLUMNS,
+    )
+    previous = previous[_is_state_file(previous["FILE_NAME"], state)]
+    previous_files = sorted(
+        set(previous["FILE_NAME"]), key=lambda file_name: _file_number(file_name, state)
+    )
+    regions = dataset.read_regions(output)
+
+    scratch = tempfile.mkdtemp(prefix=f".update-{state}-", dir=output)
+    try:
+        streets = build_state(source, scratch, state, position, max_rows, memory_limit)
+        scratch_files = sorted(glob.glob(os.path.join(scratch, f"{state}-*.parquet")))
+
+        # the streets keep their IDX and their file, the new streets get
+        # the next IDX values (the IDX values of the removed streets aren't reused)
+        streets = streets.rename(columns={"IDX": "BUILD_IDX"}).drop(columns="FILE_NAME")
+        streets = streets.merge(
+            previous[["IDX", "FILE_NAME"] + STREET_COLUMNS],
+            how="left",
+            on=STREET_COLUMNS,
+        )
+        added = streets["IDX"].isna().to_numpy()
+        start = max(
+            previous["IDX"].max() if len(previous) else 0, (position + 1) * IDX_BLOCK
+        )
+        streets.loc[added, "IDX"] = np.arange(start + 1, start + 1 + added.sum())
+        streets["IDX"] = streets["IDX"].astype(np.int64)
+
+        # the streets whose addresses changed
+        build_hashes = street_hashes(scratch_files)
+        previous_hashes = street_hashes(
+            [os.path.join(output, file_name) for file_name in previous_files], regions
+        )
+        changed = ~added & (
+            build_hashes.reindex(streets["BUILD_IDX"], fill_value=0).to_numpy()
+            != previous_hashes.reindex(streets["IDX"], fill_value=0).to_numpy()
+        )
+        removed = previous[~previous["IDX"].isin(streets["IDX"])]
+
+        # the new streets are added to the last file
+        if added.any():
+            number = _file_number(previous_files[-1], state) if previous_files else 1
+            last_file = streets["FILE_NAME"] == f"{state}-{number}.parquet"
+            streets.loc[added, "FILE_NAME"] = assign_files(
+                streets.loc[added, "ADDRESS_COUNT"].to_numpy(),
+                state,
+                max_rows,
+                number=number,
+                rows=int(streets.loc[last_file, "ADDRESS_COUNT"].sum()),
+            )
+
+        files = sorted(
+            set(streets.loc[added | changed, "FILE_NAME"]) | set(removed["FILE_NAME"]),
+            key=lambda file_name: _file_number(file_name, state),
+        )
+        scratch_dataset = ds.dataset(scratch_files, format="parquet")
+        for file_name in files:
+            file_streets = streets[streets["FILE_NAME"] == file_name]
+            if len(file_streets) == 0:
+                os.remove(os.path.join(output, file_name))
+                continue
+
+            addresses = scratch_dataset.to_table(
+                filter=ds.field("IDX").isin(file_streets["BUILD_IDX"].tolist())
+            ).to_pandas()
+            addresses["IDX"] = addresses["IDX"].map(
+                pd.Series(
+                    file_streets["IDX"].to_numpy(), index=file_streets["BUILD_IDX"]
+                )
+            )
+            addresses["FILE_NAME"] = file_name
+            write_address_files(output, address_table(addresses))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    changes = {
+        "added": int(added.sum()),
+        "changed": int(changed.sum()),
+        "removed": len(removed),
+    }
+    return streets.drop(columns="BUILD_IDX").sort_values("IDX"), files, changes
+
+
+def street_hashes(filenames, regions=None):
+    """
+    Return the hash of the addresses of each street of the address files,
+    regardless of the order of the addresses
+
+    Parameters
+    ----------
+    filenames:list
+        The paths of the address files
+    regions:pyarrow.Table
+        The regions of the units, if the files are normalized (see
+        dataset.read_regions)
+
+    Returns
+    -------
+    pandas.Series
+        The hash (uint64) by IDX
+    """
+    hashes = []
+    for filename in filenames:
+        if regions is None:
+            addresses = pd.read_parquet(filename, columns=["IDX"] + HASH_COLUMNS)
+        else:
+            addresses = dataset.join_regions(
+                pd.read_parquet(
+                    filename,
+                    columns=["IDX", dataset.REGION_KEY]
+                    + [
+                        column
+                        for column in HASH_COLUMNS
+                        if column not in regions.schema.names
+                    ],
+                ),
+                regions,
+                ["IDX"] + HASH_COLUMNS,
+            )
+
+        # the sum of the hashes of the addresses (modulo 2^64)
+        row_hashes = pd.util.hash_pandas_object(addresses[HASH_COLUMNS], index=False)
+        hashes.append(row_hashes.groupby(addresses["IDX"].to_numpy()).sum())
+
+    if not hashes:
+        return pd.Series([], dtype=np.uint64)
+    return pd.concat(hashes).groupby(level=0).sum()
+
+
+def peak_memory():
+    """
+    Return the peak resident set size (RSS) of the build process and of
+    its largest child (worker) process
+
+    Returns
+    -------
+    tuple
+        The peak RSS of the process and of the largest child process (MB),
+        or None if it can't be measured (on Windows)
+    """
+    if resource is None:
+        return None
+
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    return tuple(
+        resource.getrusage(who).ru_maxrss * unit / 2 ** 20
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+    )
+
+
+def build_dataset(
+    source,
+    output,
+    states=STATES,
+    max_rows=MAX_ROWS,
+    workers=None,
+    normalize=False,
+    memory_limit=None,
+):
+    """
+    Build the reference dataset: the address files, the index file and
+    the auxiliary files
+
+    Parameters
+    ----------
+    source:string
+        The folder of the release files
+    output:string
+        The folder of the dataset, e.g. data/Australia
+    states:list
+        The states to be built. The other states of a dataset already
+        built into the output folder are kept (in the index and the
+        auxiliary files), and the rebuilt states use the layout of the
+        dataset if it's normalized
+    max_rows:int
+        The maximum number of addresses in an address file
+    workers:int
+        The number of processes building the states.
+        If it's empty (None), the number of CPUs is used
+    normalize:boolean
+        Whether to move the regions into the regions file (see
+        dataset.normalize_regions)
+    memory_limit:float
+        The approximate memory ceiling (MB) of the build, shared by the
+        worker processes. If it's empty (None), each state is read and
+        joined in memory, otherwise the states are built in parts (see
+        build_state_streaming)
+
+    Returns
+    -------
+    pandas.DataFrame
+        The index of the streets
+
+    Examples
+    --------
+    >>> index = build_dataset("gnaf", "data/Australia", workers=4)
+    """
+    unknown = [state for state in states if state not in STATES]
+    if unknown:
+        raise ValueError(f"Unknown states: {unknown}")
+    if max_rows <= 0:
+        raise ValueError("The maximum number of rows must be positive")
+    if memory_limit is not None and memory_limit <= 0:
+        raise ValueError("The memory limit must be positive")
+
+    # the streets of the states of an existing dataset that aren't rebuilt
+    kept = _read_kept_index(output, states)
+    regions = dataset.read_regions(output) if kept is not None else None
+    if kept is None and os.path.isfile(os.path.join(output, dataset.REGIONS_FILE)):
+        # the regions of the replaced dataset
+        os.remove(os.path.join(output, dataset.REGIONS_FILE))
+
+    processes = min(workers or os.cpu_count() or 1, len(states))
+    if memory_limit is not None:
+        memory_limit = memory_limit / processes
+
+    os.makedirs(output, exist_ok=True)
+    arguments = [
+        (source, output, state, STATES.index(state), max_rows, memory_limit)
+        for state in states
+    ]
+
+    if processes == 1:
+        indexes = [build_state(*argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(build_state, *argument) for argument in arguments
+            ]
+            indexes = [future.result() for future in futures]
+
+    index = pd.concat(indexes, ignore_index=True)
+    index["ADDRESS"] = (
+        index[STREET_COLUMNS[0]]
+        .fillna("")
+        .str.cat([index[column].fillna("") for column in STREET_COLUMNS[1:]], sep=" ")
+    )
+    index = index[INDEX_COLUMNS]
+    if kept is not None:
+        index = (
+            pd.concat([kept, index], ignore_index=True)
+            .sort_values("IDX", kind="stable")
+            .reset_index(drop=True)
+        )
+    pq.write_table(
+        pa.Table.from_pandas(index, preserve_index=False),
+        os.path.join(output, dataset.INDEX_FILE),
+    )
+
+    # the rebuilt states of a normalized dataset refer to its regions by key
+    if regions is not None:
+        _add_region_keys(
+            output,
+            [
+                file_name
+                for state_index in indexes
+                for file_name in state_index["FILE_NAME"].unique()
+            ],
+            regions,
+        )
+
+    # the grid of the address counts, used to estimate
+    # the initial search radius of the coordinate-based matching
+    dataset.build_density_grid(output)
+
+    # the representative points of the meshblocks,
+    # used by the region-only coordinate-based matching
+    dataset.build_meshblock_index(output, AUS)
+
+    # the centroids and the bounding boxes of the streets,
+    # used by the street-based coordinate matching
+    dataset.add_street_centroids(output)
+
+    if normalize and regions is None:
+        dataset.normalize_regions(output, AUS)
+
+    return index
+
+
+def _read_kept_index(output, states):
+    """
+    Return the index rows of the states of the dataset in the output folder
+    that aren't in the states to be built, or None if there are none.
+    Raise ValueError if their address files can't be kept.
+    """
+    if not os.path.isdir(output):
+        return None
+
+    kept_files = [
+        os.path.basename(filename)
+        for filename in dataset.get_address_files(output)
+        if not any(
+            _file_number(os.path.basename(filename), state) is not None
+            for state in states
+        )
+    ]
+    if not kept_files:
+        return None
+
+    index_filename = os.path.join(output, dataset.INDEX_FILE)
+    names = (
+        pq.read_schema(index_filename).names if os.path.isfile(index_filename) else []
+    )
+    if any(column not in names for column in INDEX_COLUMNS):
+        raise ValueError(
+            f"The other states of the dataset weren't built by addrmatcher-build, "
+            f"build all the states or use an empty folder: {output}"
+        )
+
+    index = pd.read_parquet(index_filename, columns=INDEX_COLUMNS)
+    return index[index["FILE_NAME"].astype(str).isin(kept_files)].reset_index(drop=True)
+
+
+def _add_region_keys(output, file_names, regions):
+    """
+    Replace the regions of the address files with the keys of the regions
+    of a normalized dataset (see dataset.add_region_keys), and write the
+    regions file
+    """
+    for file_name in file_names:
+        filename = os.path.join(output, file_name)
+        if not os.path.isfile(filename):
+            continue
+
+        table, regions = dataset.add_region_keys(pq.read_table(filename), regions, AUS)
+        pq.write_table(table, filename + ".tmp", row_group_size=ROW_GROUP_SIZE)
+        os.replace(filename + ".tmp", filename)
+    pq.write_table(regions, os.path.join(output, dataset.REGIONS_FILE))
+
+
+def update_dataset(
+    source, output, states=STATES, max_rows=MAX_ROWS, workers=None, memory_limit=None
+):
+    """
+    Update the reference dataset built by build_dataset from a new release,
+    e.g. the quarterly release of G-NAF. Only the address files holding
+    new, changed or removed streets are rewritten, and the streets keep
+    their IDX (see update_state). The index file and the auxiliary files
+    are updated.
+
+    Parameters
+    ----------
+    source:string
+        The folder of the release files
+    output:string
+        The folder of the dataset, e.g. data/Australia
+    states:list
+        The states to be updated
+    max_rows:int
+        The maximum number of addresses in an address file
+    workers:int
+        The number of processes updating the states.
+        If it's empty (None), the number of CPUs is used
+    memory_limit:float
+        The approximate memory ceiling (MB) of the update, see build_dataset
+
+    Returns
+    -------
+    tuple
+        The index of the streets (pandas.DataFrame), the rewritten address
+        files (list) and the number of new, changed and removed streets
+        (dictionary)
+
+    Examples
+    --------
+    >>> index, files, changes = update_dataset("gnaf-2021-11", "data/Australia")
+    >>> changes
+    {'added': 1530, 'changed': 20412, 'removed': 312}
+    """
+    unknown = [state for state in states if state not in STATES]
+    if unknown:
+        raise ValueError(f"Unknown states: {unknown}")
+    if max_rows <= 0:
+        raise ValueError("The maximum number of rows must be positive")
+    if memory_limit is not None and memory_limit <= 0:
+        raise ValueError("The memory limit must be positive")
+
+    index_filename = os.path.join(output, dataset.INDEX_FILE)
+    if not os.path.isfile(index_filename):
+        raise ValueError(f"The dataset doesn't exist: {output}")
+
+    regions = dataset.read_regions(output)
+    for filename in dataset.get_address_files(output):
+        names = pq.read_schema(filename).names
+        expected = [
+            column
+            for column in HASH_COLUMNS
+            if regions is None or column not in regions.schema.names
+        ]
+        if any(column not in names for column in expected):
+            raise ValueError(
+                f"The dataset wasn't built by addrmatcher-build, "
+                f"build it again instead: {filename}"
+            )
+
+    processes = min(workers or os.cpu_count() or 1, len(states))
+    if memory_limit is not None:
+        memory_limit = memory_limit / processes
+
+    arguments = [
+        (source, output, state, STATES.index(state), max_rows, memory_limit)
+        for state in states
+    ]
+    if processes == 1:
+        results = [update_state(*argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(update_state, *argument) for argument in arguments
+            ]
+            results = [future.result() for future in futures]
+
+    files = [file_name for result in results for file_name in result[1]]
+    changes = {
+        name: sum(result[2][name] for result in results)
+        for name in ["added", "changed", "removed"]
+    }
+
+    # replace the index rows of the updated states
+    index = pd.read_parquet(index_filename, columns=INDEX_COLUMNS)
+    updated = np.zeros(len(index), dtype=bool)
+    for state in states:
+        updated |= _is_state_file(index["FILE_NAME"], state)
+    streets = pd.concat([result[0] for result in results], ignore_index=True)
+    streets["ADDRESS"] = (
+        streets[STREET_COLUMNS[0]]
+        .fillna("")
+        .str.cat([streets[column].fillna("") for column in STREET_COLUMNS[1:]], sep=" ")
+    )
+    index = (
+        pd.concat([index[~updated], streets[INDEX_COLUMNS]], ignore_index=True)
+        .sort_values("IDX", kind="stable")
+        .reset_index(drop=True)
+    )
+    pq.write_table(pa.Table.from_pandas(index, preserve_index=False), index_filename)
+
+    # the rewritten files of a normalized dataset refer to the regions by key
+    if regions is not None:
+        _add_region_keys(output, files, regions)
+
+    dataset.build_density_grid(output)
+    dataset.build_meshblock_index(output, AUS)
+    dataset.add_street_centroids(output)
+
+    return index, files, changes
+
+
+def main():
+    """Build the reference dataset, reading the arguments from user's command line interface."""
+
+    parser = argparse.ArgumentParser(
+        description="Build the reference dataset from the G-NAF and ASGS releases"
+    )
+    parser.add_argument(
+        "--source", default=".", help="The folder of the release files (default: .)"
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join("data", "Australia"),
+        help="The folder of the dataset (default: data/Australia)",
+    )
+    parser.add_argument(
+        "--states",
+        nargs="+",
+        default=STATES,
+        help="The states to be built (default: all the states)",
+    )
+    parser.add_argument(
+        "--max-rows",
+        type=int,
+        default=MAX_ROWS,
+        help=f"The maximum number of addresses in an address file (default: {MAX_ROWS})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of processes building the states (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="Move the regions into the regions file (the normalized layout)",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Update the dataset of the output folder, rewrite the changed files only",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=float,
+        default=None,
+        help="Build the states in parts, using about this much memory (MB) in total",
+    )
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.update:
+        index, files, changes = update_dataset(
+            args.source,
+            args.output,
+            states=args.states,
+            max_rows=args.max_rows,
+            workers=args.workers,
+            memory_limit=args.memory_limit,
+        )
+        print(
+            f"Updated {', '.join(args.states)} in {time.perf_counter() - start:.1f} s: "
+            f"{changes['added']} new, {changes['changed']} changed and "
+            f"{changes['removed']} removed streets, {len(files)} files rewritten"
+        )
+    else:
+        index = build_dataset(
+            args.source,
+            args.output,
+            states=args.states,
+            max_rows=args.max_rows,
+            workers=args.workers,
+            normalize=args.normalize,
+            memory_limit=args.memory_limit,
+        )
+        print(
+            f"Built {len(index)} streets of {', '.join(args.states)} "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+    memory = peak_memory()
+    if memory is not None:
+        print(f"Peak RSS: {memory[0]:.0f} MB, largest worker: {memory[1]:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Result cache of the coordinate-based matching
+"""
+from collections import OrderedDict, namedtuple
+import threading
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class CoordinateCache:
+    """
+    The CoordinateCache class stores the results of the coordinate-based
+    matching. The coordinates are snapped to a grid, so that the points
+    reported from the same place (e.g. a depot or a stop) share the same
+    entry. The least recently used entry is evicted when the cache is full.
+
+    The matched addresses (or units) are reused by all the points of a
+    cell. Their distance is calculated from each point and they are sorted
+    by it, but the set of the n nearest addresses isn't searched again, so
+    a coarse precision can return a different set than the search of the
+    point. The cell size should be small enough for the matched addresses
+    not to change within a cell (about 1 meter by default).
+
+    Parameters
+    ----------
+    maxsize: integer
+        The maximum number of entries (default = 100000)
+    precision: float
+        The cell size of the grid in degrees (default = 0.00001, about 1 meter)
+
+    Examples
+    --------
+    >>> cache = CoordinateCache(maxsize=50000)
+    >>> matcher = GeoMatcher(AUS, cache=cache)
+    >>> matcher.get_region_by_coordinates(-26.657299, 153.094955)
+    >>> matcher.get_region_by_coordinates(-26.657301, 153.094956)
+    >>> cache.info()
+    CacheInfo(hits=1, misses=1, maxsize=50000, currsize=1)
+    """
+
+    __slots__ = ("_maxsize", "_precision", "_entries", "_hits", "_misses", "_lock")
+
+    def __init__(self, maxsize=100000, precision=0.00001):
+        if maxsize < 1:
+            raise ValueError("The cache size must be at least 1")
+
+        if precision <= 0:
+            raise ValueError("The cache precision has to be larger than 0")
+
+        self._maxsize = maxsize
+        self._precision = precision
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        """
+        Return the ratio of the lookups found in the cache
+        """
+        lookups = self._hits + self._misses
+        return self._hits / lookups if lookups else 0.0
+
+    def make_key(self, lat, lon, *args):
+        """
+        Return the key of the coordinates snapped to the grid and the other
+        arguments of the matching. Lists are converted into tuples.
+        """
+        return (
+            round(lat / self._precision),
+            round(lon / self._precision),
+        ) + tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+
+    def get(self, key):
+        """
+        Return a copy of the cached result, or None if the key isn't cached
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+        return {column: list(values) for column, values in result.items()}
+
+    def put(self, key, result):
+        """
+        Store a copy of the result, and evict the least recently used
+        entry if the cache is full
+        """
+        result = {column: list(values) for column, values in result.items()}
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all the entries and reset the statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def info(self):
+        """
+        Return the statistics of the cache
+
+        Returns
+        -------
+        CacheInfo
+            the number of hits, misses, the maximum and the current number of entries
+        """
+        with self._lock:
+            return CacheInfo(
+                self._hits, self._misses, self._maxsize, len(self._entries)
+            )
@@ -0,0 +1,581 @@
+"""
+The auxiliary files of the reference dataset, created at the dataset build time
+"""
+import os
+import glob
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .spatial import DensityGrid
+
+INDEX_FILE = "index.parquet"
+DENSITY_FILE = "density.parquet"
+MESHBLOCK_FILE = "meshblock.parquet"
+REGIONS_FILE = "regions.parquet"
+
+# the column of the normalized address files referring to
+# the row of the regions file (the smallest regional unit, e.g. meshblock)
+REGION_KEY = "MB_KEY"
+
+# the maximum number of representative points of a meshblock
+# (the centroid and the four extreme addresses)
+MESHBLOCK_POINTS = 5
+
+# the parquet files within the dataset folder that don't store addresses
+AUXILIARY_FILES = (INDEX_FILE, DENSITY_FILE, MESHBLOCK_FILE, REGIONS_FILE)
+
+# the columns of the index file used by the matching
+INDEX_COLUMNS = [
+    "IDX",
+    "ADDRESS",
+    "FILE_NAME",
+    "STREET_NAME",
+    "STREET_TYPE_CODE",
+    "LOCALITY_NAME",
+    "STATE",
+    "POSTCODE",
+    "ADDRESS_COUNT",
+    "LATITUDE",
+    "LONGITUDE",
+    "MIN_LATITUDE",
+    "MAX_LATITUDE",
+    "MIN_LONGITUDE",
+    "MAX_LONGITUDE",
+]
+
+# the low-cardinality columns of the index file, loaded as categorical
+INDEX_CATEGORICAL_COLUMNS = [
+    "FILE_NAME",
+    "STREET_NAME",
+    "STREET_TYPE_CODE",
+    "LOCALITY_NAME",
+    "STATE",
+    "POSTCODE",
+]
+
+
+def get_address_files(file_location, extension=".parquet"):
+    """
+    Return the parquet files within the dataset folder that store the addresses
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+    extension:string
+        The extension of the address files, e.g. .arrow for the Arrow IPC
+        files (see store.convert_dataset)
+
+    Returns
+    -------
+    list
+        The paths of the address files
+    """
+    return [
+        filename
+        for filename in sorted(glob.glob(os.path.join(file_location, "*" + extension)))
+        if os.path.basename(filename) not in AUXILIARY_FILES
+    ]
+
+
+def build_density_grid(file_location, cell_size=0.1):
+    """
+    Count the addresses per grid cell and save the grid into the dataset folder.
+    The grid is used to estimate the initial search radius of
+    the coordinate-based matching.
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+    cell_size:float
+        The width and height of a cell in degrees (default = 0.1, about 11 km)
+
+    Returns
+    -------
+    DensityGrid
+        The grid of the address counts
+
+    Examples
+    --------
+    >>> grid = build_density_grid("data/Australia")
+    >>> grid.count(-33.9, -33.8, 151.1, 151.3)
+    """
+    rows, cols, counts = [], [], []
+    for filename in get_address_files(file_location):
+        coordinates = pq.read_table(filename, columns=["LATITUDE", "LONGITUDE"])
+        file_rows, file_cols, file_counts = DensityGrid.from_points(
+            coordinates["LATITUDE"].to_numpy(),
+            coordinates["LONGITUDE"].to_numpy(),
+            cell_size,
+        ).to_cells()
+        rows.append(file_rows)
+        cols.append(file_cols)
+        counts.append(file_counts)
+
+    # merge the cells of all the files (the counts of the same cell are summed)
+    rows, cols, counts = (
+        np.concatenate(rows),
+        np.concatenate(cols),
+        np.concatenate(counts),
+    )
+    grid = DensityGrid.from_cells(rows, cols, counts, cell_size)
+
+    rows, cols, counts = grid.to_cells()
+    table = pa.table(
+        {
+            "LATITUDE_CELL": pa.array(rows, type=pa.int32()),
+            "LONGITUDE_CELL": pa.array(cols, type=pa.int32()),
+            "ADDRESS_COUNT": pa.array(np.rint(counts).astype(np.int64)),
+        }
+    ).replace_schema_metadata({"cell_size": str(cell_size)})
+    pq.write_table(table, os.path.join(file_location, DENSITY_FILE))
+
+    return grid
+
+
+def read_density_grid(file_location):
+    """
+    Read the grid of the address counts from the dataset folder
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+
+    Returns
+    -------
+    DensityGrid
+        The grid of the address counts,
+        or None if the dataset doesn't have the density file
+    """
+    filename = os.path.join(file_location, DENSITY_FILE)
+    if not os.path.isfile(filename):
+        return None
+
+    table = pq.read_table(filename)
+    cell_size = float(table.schema.metadata[b"cell_size"])
+    return DensityGrid.from_cells(
+        table["LATITUDE_CELL"].to_numpy(),
+        table["LONGITUDE_CELL"].to_numpy(),
+        table["ADDRESS_COUNT"].to_numpy(),
+        cell_size,
+    )
+
+
+def read_index(file_location):
+    """
+    Read the index file from the dataset folder in a compact form: only the
+    columns used by the matching are read, the low-cardinality text columns
+    are dictionary encoded (categorical) and the integer columns are stored
+    in the narrowest type. The coordinates stay double precision, as the
+    street bounding boxes are used as exact lower bounds of the distance.
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+
+    Returns
+    -------
+    DataFrame
+        The index of the streets (IDX)
+    """
+    filename = os.path.join(file_location, INDEX_FILE)
+    names = pq.read_schema(filename).names
+    index_data = pq.read_table(
+        filename,
+        columns=[column for column in INDEX_COLUMNS if column in names],
+        read_dictionary=[
+            column for column in INDEX_CATEGORICAL_COLUMNS if column in names
+        ],
+    ).to_pandas()
+
+    for column in ("IDX", "ADDRESS_COUNT"):
+        if column in index_data.columns and index_data[column].notna().all():
+            index_data[column] = pd.to_numeric(index_data[column], downcast="integer")
+
+    return index_data
+
+
+def build_meshblock_index(file_location, hierarchy):
+    """
+    Create the representative points of the smallest regional unit
+    (e.g. meshblock) and save them into the dataset folder, with all the
+    regions of the hierarchy the unit belongs to.
+
+    Each unit is represented by the centroid of its addresses and by its
+    northernmost, southernmost, easternmost and westernmost addresses,
+    so that the nearest point is likely to be in the same unit as the
+    input coordinates, even near the unit's boundary.
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+    hierarchy:GeoHierarchy
+        The hierarchy of the regions stored in the dataset, e.g. AUS
+
+    Returns
+    -------
+    DataFrame
+        The representative points of the units
+
+    Examples
+    --------
+    >>> meshblocks = build_meshblock_index("data/Australia", AUS)
+    """
+    unit_column, region_columns = _get_region_columns(hierarchy)
+
+    region_table = read_regions(file_location)
+
+    summaries, extremes, regions = [], [], []
+    for filename in get_address_files(file_location):
+        if region_table is None:
+            addresses = pd.read_parquet(
+                filename, columns=["LATITUDE", "LONGITUDE"] + region_columns
+            )
+        else:
+            addresses = join_regions(
+                pd.read_parquet(filename, columns=["LATITUDE", "LONGITUDE", REGION_KEY]),
+                region_table,
+                ["LATITUDE", "LONGITUDE"] + region_columns,
+            )
+        groups = addresses.groupby(unit_column)
+
+        summaries.append(
+            groups.agg(
+                LATITUDE=("LATITUDE", "sum"),
+                LONGITUDE=("LONGITUDE", "sum"),
+                ADDRESS_COUNT=("LATITUDE", "size"),
+            )
+        )
+        extremes.append(_get_extreme_points(addresses, unit_column))
+        regions.append(addresses.drop_duplicates(unit_column)[region_columns])
+
+    # a unit can be stored in more than one address file,
+    # combine the summaries and the extreme points of all the files
+    summary = pd.concat(summaries).groupby(level=0).sum()
+    centroids = pd.DataFrame(
+        {
+            unit_column: summary.index,
+            "LATITUDE": summary["LATITUDE"].values / summary["ADDRESS_COUNT"].values,
+            "LONGITUDE": summary["LONGITUDE"].values / summary["ADDRESS_COUNT"].values,
+        }
+    )
+    extreme_points = _get_extreme_points(
+        pd.concat(extremes, ignore_index=True), unit_column
+    )
+
+    meshblocks = (
+        pd.concat([centroids, extreme_points], ignore_index=True)
+        .drop_duplicates()
+        .merge(
+            pd.concat(regions).drop_duplicates(unit_column), how="inner", on=unit_column
+        )
+        .sort_values(unit_column, kind="stable")
+        .reset_index(drop=True)
+    )
+    meshblocks.to_parquet(os.path.join(file_location, MESHBLOCK_FILE), index=False)
+
+    return meshblocks
+
+
+def _get_extreme_points(addresses, unit_column):
+    """
+    Return the northernmost, southernmost, easternmost and westernmost
+    addresses of each unit
+    """
+    groups = addresses.groupby(unit_column)
+    positions = pd.concat(
+        [
+            groups["LATITUDE"].idxmin(),
+            groups["LATITUDE"].idxmax(),
+            groups["LONGITUDE"].idxmin(),
+            groups["LONGITUDE"].idxmax(),
+        ]
+    ).unique()
+    return addresses.loc[positions, [unit_column, "LATITUDE", "LONGITUDE"]]
+
+
+def read_meshblock_index(file_location):
+    """
+    Read the representative points of the smallest regional unit
+    (e.g. meshblock) from the dataset folder
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+
+    Returns
+    -------
+    DataFrame
+        The representative points of the units and their regions,
+        or None if the dataset doesn't have the meshblock file
+    """
+    filename = os.path.join(file_location, MESHBLOCK_FILE)
+    if not os.path.isfile(filename):
+        return None
+
+    return pd.read_parquet(filename)
+
+
+def add_street_centroids(file_location):
+    """
+    Add the centroid and the bounding box of the addresses of each street
+    (IDX) into the index file. They are used by the street-based search of
+    the coordinate-based matching to find the streets near the input
+    coordinates, before reading their addresses.
+
+    The added columns are LATITUDE, LONGITUDE (the centroid), MIN_LATITUDE,
+    MAX_LATITUDE, MIN_LONGITUDE and MAX_LONGITUDE.
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+
+    Returns
+    -------
+    DataFrame
+        The index with the centroids and the bounding boxes
+
+    Examples
+    --------
+    >>> index = add_street_centroids("data/Australia")
+    """
+    streets = []
+    for filename in get_address_files(file_location):
+        addresses = pd.read_parquet(filename, columns=["IDX", "LATITUDE", "LONGITUDE"])
+        streets.append(
+            addresses.groupby("IDX").agg(
+                LATITUDE=("LATITUDE", "mean"),
+                LONGITUDE=("LONGITUDE", "mean"),
+                MIN_LATITUDE=("LATITUDE", "min"),
+                MAX_LATITUDE=("LATITUDE", "max"),
+                MIN_LONGITUDE=("LONGITUDE", "min"),
+                MAX_LONGITUDE=("LONGITUDE", "max"),
+            )
+        )
+
+    streets = pd.concat(streets)
+    index_data = pd.read_parquet(os.path.join(file_location, INDEX_FILE))
+
+    # replace the centroids of the previous build, if exist
+    index_data = index_data.drop(
+        columns=[column for column in streets.columns if column in index_data.columns]
+    ).merge(streets, how="left", left_on="IDX", right_index=True)
+    index_data.to_parquet(os.path.join(file_location, INDEX_FILE), index=False)
+
+    return index_data
+
+
+def normalize_regions(file_location, hierarchy):
+    """
+    Convert the address files into the normalized layout: the region
+    columns of the hierarchy are moved into the regions file, with one row
+    per smallest regional unit (e.g. meshblock), and replaced by the
+    integer key of the unit's row (MB_KEY) in the address files.
+    The regions are joined to the matched addresses on output only, which
+    reduces the size of the files and the time to decode them.
+
+    The order of the addresses and the row group size of the files are kept.
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+    hierarchy:GeoHierarchy
+        The hierarchy of the regions stored in the dataset, e.g. AUS
+
+    Returns
+    -------
+    pyarrow.Table
+        The regions of the units
+
+    Examples
+    --------
+    >>> regions = normalize_regions("data/Australia", AUS)
+    """
+    if os.path.isfile(os.path.join(file_location, REGIONS_FILE)):
+        raise ValueError(f"The dataset is already normalized: {file_location}")
+
+    unit_column, region_columns = _get_region_columns(hierarchy)
+    filenames = get_address_files(file_location)
+
+    # the regions of the units, the row position of a unit is its key
+    regions = (
+        pd.concat(
+            [
+                pd.read_parquet(filename, columns=region_columns).drop_duplicates()
+                for filename in filenames
+            ]
+        )
+        .dropna(subset=[unit_column])
+        .drop_duplicates()
+        .sort_values(unit_column)
+        .reset_index(drop=True)
+    )
+    if regions[unit_column].duplicated().any():
+        raise ValueError(
+            f"The regions aren't determined by the {unit_column} column, "
+            f"some units belong to more than one region"
+        )
+
+    units = pd.Index(regions[unit_column])
+    for filename in filenames:
+        metadata = pq.ParquetFile(filename).metadata
+        table = pq.read_table(filename)
+
+        table = _to_region_keys(table, units, unit_column, region_columns)
+
+        # replace the file once it's completely written
+        pq.write_table(
+            table,
+            filename + ".tmp",
+            row_group_size=metadata.row_group(0).num_rows
+            if metadata.num_row_groups > 0
+            else None,
+        )
+        os.replace(filename + ".tmp", filename)
+
+    regions = pa.Table.from_pandas(regions, preserve_index=False)
+    pq.write_table(regions, os.path.join(file_location, REGIONS_FILE))
+
+    return regions
+
+
+def add_region_keys(addresses, regions, hierarchy):
+    """
+    Replace the region columns of the addresses with the key of their
+    smallest regional unit (MB_KEY), i.e. convert the addresses into the
+    normalized layout. The units missing from the regions are appended to
+    the regions, so that the keys of the other units don't change.
+
+    Parameters
+    ----------
+    addresses:pyarrow.Table
+        The addresses with the region columns of the hierarchy
+    regions:pyarrow.Table
+        The regions of the units, see read_regions
+    hierarchy:GeoHierarchy
+        The hierarchy of the regions stored in the dataset, e.g. AUS
+
+    Returns
+    -------
+    tuple
+        The addresses with the region key (pyarrow.Table) and
+        the regions, with the appended units (pyarrow.Table)
+    """
+    unit_column, region_columns = _get_region_columns(hierarchy)
+
+    units = (
+        addresses.select(regions.schema.names)
+        .to_pandas()
+        .dropna(subset=[unit_column])
+        .drop_duplicates(unit_column)
+    )
+    units = units[~units[unit_column].isin(regions.column(unit_column).to_pandas())]
+    if len(units) > 0:
+        regions = pa.concat_tables(
+            [
+                regions,
+                pa.Table.from_pandas(
+                    units.sort_values(unit_column),
+                    schema=regions.schema,
+                    preserve_index=False,
+                ),
+            ]
+        )
+
+    units = pd.Index(regions.column(unit_column).to_pandas())
+    return _to_region_keys(addresses, units, unit_column, region_columns), regions
+
+
+def _get_region_columns(hierarchy):
+    """
+    Return the column of the smallest regional unit and the region columns
+    of the hierarchy
+    """
+    unit_column = hierarchy.get_smallest_region_boundaries().col_name
+    region_columns = list(
+        dict.fromkeys(filter(None, hierarchy.get_regions_by_name(attribute="col_name")))
+    )
+    return unit_column, region_columns
+
+
+def _to_region_keys(addresses, units, unit_column, region_columns):
+    """
+    Replace the region columns of the addresses (pyarrow.Table) with the
+    position of their unit within the units (MB_KEY)
+    """
+    positions = units.get_indexer(addresses.column(unit_column).to_pandas())
+    return addresses.drop(region_columns).append_column(
+        REGION_KEY, pa.array(positions, type=pa.int32(), mask=positions < 0)
+    )
+
+
+def read_regions(file_location):
+    """
+    Read the regions of the smallest regional units of the normalized layout
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+
+    Returns
+    -------
+    pyarrow.Table
+        The regions of the units (the row position is the unit's key),
+        or None if the dataset isn't normalized
+    """
+    filename = os.path.join(file_location, REGIONS_FILE)
+    if not os.path.isfile(filename):
+        return None
+
+    return pq.read_table(filename)
+
+
+def join_regions(addresses, regions, columns):
+    """
+    Replace the region key of the addresses (normalized layout)
+    with the region columns
+
+    Parameters
+    ----------
+    addresses:DataFrame or pyarrow.RecordBatch
+        The addresses with the region key column (MB_KEY)
+    regions:pyarrow.Table
+        The regions of the units, see read_regions
+    columns:list
+        The columns to be returned, the columns not found in the addresses
+        are taken from the regions
+
+    Returns
+    -------
+    DataFrame or pyarrow.Table
+        The addresses with the columns (DataFrame if the addresses are a DataFrame)
+    """
+    if isinstance(addresses, pd.DataFrame):
+        region_columns = [column for column in columns if column not in addresses.columns]
+        joined = (
+            regions.select(region_columns)
+            .take(pa.array(addresses[REGION_KEY], type=pa.int32(), from_pandas=True))
+            .to_pandas()
+        )
+        joined.index = addresses.index
+        return pd.concat([addresses, joined], axis=1)[columns]
+
+    matched = regions.take(addresses.column(REGION_KEY))
+    return pa.Table.from_arrays(
+        [
+            addresses.column(column)
+            if column in addresses.schema.names
+            else matched.column(column)
+            for column in columns
+        ],
+        names=columns,
+    )
@@ -6,6 +6,10 @@ class GeoHierarchy:
     """
     The GeoHierarchy class represents the structure of a country's region/area;
     for instance, a state or a province is the sub-region of a country.
+
+    The tree of the regions is flattened into lookup tables on the first
+    query (see get_regions_by_name), and the results of the queries are
+    memoized. Adding a region or a type resets them.
     """
 
     __slots__ = (
@@ -14,6 +18,8 @@ class GeoHierarchy:
         "_country",
         "_country_name",
         "_coordinate_boundary",
+        "_lookups",
+        "_results",
     )
 
     def __init__(self, country, name, coordinate_boundary=None):
@@ -22,6 +28,8 @@ class GeoHierarchy:
         self._type_root = {}
         self._country = self._Node(country)
         self._country_name = name
+        self._lookups = None
+        self._results = {}
         if coordinate_boundary is not None:
             self.set_coordinate_boundary(*coordinate_boundary)
 
@@ -169,6 +177,7 @@ class GeoHierarchy:
             self._types[type_id] = type_id
 
         self._type_root[type_id] = region
+        self._reset_lookups()
 
     def add_region(self, region, parent_region):
         """
@@ -208,6 +217,50 @@ class GeoHierarchy:
             else:
                 raise ValueError(f"Parent {str(parent_region)} is not found")
 
+        self._reset_lookups()
+
+    def _reset_lookups(self):
+        """
+        Remove the flattened lookups and the memoized results,
+        after the hierarchy is modified
+        """
+        self._lookups = None
+        self._results = {}
+
+    def _get_lookups(self):
+        """
+        Return the lookups of the flattened tree, built on the first use:
+        all the nodes, the node by its (lower case) name and short name,
+        and the lower (le) and upper (ge) level nodes of each node
+        """
+        if self._lookups is None:
+            nodes_by_name = {}
+            lower_nodes = {}
+            upper_nodes = {}
+
+            # the first node of a name in the depth-first order is kept,
+            # the same node as found by _Node.get_node_by_name
+            stack = [self._country]
+            while stack:
+                node = stack.pop()
+                nodes_by_name.setdefault(node.region.name.lower(), node)
+                nodes_by_name.setdefault(node.region.short_name.lower(), node)
+                stack.extend(reversed(node.children))
+
+            for node in nodes_by_name.values():
+                lower_nodes[id(node)] = node.get_all_nodes()
+                upper_nodes[id(node)] = self._country.get_all_nodes(
+                    lowest_region=node.region
+                )
+
+            self._lookups = (
+                self._country.get_all_nodes(),
+                nodes_by_name,
+                lower_nodes,
+                upper_nodes,
+            )
+        return self._lookups
+
     def get_regions_by_name(self, region_names=None, operator=None, attribute=None):
         """
         Get all the relevant regions from the hierarchy based on the given parameters
@@ -262,6 +315,21 @@ class GeoHierarchy:
         SA4
         """
 
+        # return the memoized result of the same arguments
+        key = (
+            isinstance(region_names, list),
+            tuple(region_names) if isinstance(region_names, list) else region_names,
+            operator,
+            attribute,
+        )
+        try:
+            regions = self._results.get(key)
+        except TypeError:
+            # the arguments can't be memoized
+            key, regions = None, None
+        if regions is not None:
+            return list(regions)
+
         # validate the arguments
         if operator is not None:
             if operator not in [le, ge]:
@@ -290,49 +358,41 @@ class GeoHierarchy:
                     "Invalid attribute value. Select one of name, short_name, or col_name"
                 )
 
-        regions = []
+        all_nodes, nodes_by_name, lower_nodes, upper_nodes = self._get_lookups()
+
+        nodes = []
         # get multiple region. names are provided
         if (isinstance(region_names,list)) or (region_names and operator is None):
             if not isinstance(region_names,list):
                 region_names = [region_names]
                 
             for reg_name in region_names:
-                node = self._country.get_node_by_name(reg_name)
+                node = nodes_by_name.get(reg_name.lower())
                 if node is not None:
-                    if (attribute is None) or (not attribute.strip()):
-                        regions.append(node.region)
-                    else:
-                        regions.append(getattr(node.region, attribute))
+                    nodes.append(node)
                 else:
                     ValueError("Region is not found")
         # get all the corresponding regions based on the operator 'ge' or 'le'
         elif region_names and operator is not None:
-            reference_node = self._country.get_node_by_name(region_names)
+            reference_node = nodes_by_name.get(region_names.lower())
             if reference_node is not None:
                 if operator == ge:
-                    nodes = self._country.get_all_nodes(
-                        lowest_region=reference_node.region
-                    )
-                else:
-                    nodes = reference_node.get_all_nodes()
-                
-                if (attribute is None) or (not attribute.strip()):
-                    for node in nodes:
-                        regions.append(node.region)
+                    nodes = upper_nodes[id(reference_node)]
                 else:
-                    for node in nodes:
-                        regions.append(getattr(node.region, attribute))
+                    nodes = lower_nodes[id(reference_node)]
             else:
                 ValueError("Region is not found")
         # get all the nodes
         else:
-            nodes = self._country.get_all_nodes()
-            if (attribute is None) or (not attribute.strip()):
-                for node in nodes:
-                    regions.append(node.region)
-            else:
-                for node in nodes:
-                    regions.append(getattr(node.region, attribute))
+            nodes = all_nodes
+
+        if (attribute is None) or (not attribute.strip()):
+            regions = [node.region for node in nodes]
+        else:
+            regions = [getattr(node.region, attribute) for node in nodes]
+
+        if key is not None:
+            self._results[key] = tuple(regions)
 
         return regions
 
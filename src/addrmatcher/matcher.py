@@ -1,14 +1,19 @@
-from rapidfuzz import fuzz
-from rapidfuzz.string_metric import jaro_similarity, jaro_winkler_similarity
 import pandas as pd
 import numpy as np
 import re
 import os
-import glob
 from pyarrow import fs
-import pyarrow.parquet as pq
-from sklearn.neighbors import BallTree
+import pyarrow as pa
+import pyarrow.dataset as ds
 from enum import Enum
+from functools import partial
+import asyncio
+import weakref
+from . import spatial
+from . import dataset
+from . import stats
+from . import store
+from .stats import Stage
 
 
 class DistanceMethod(Enum):
@@ -16,7 +21,78 @@ class DistanceMethod(Enum):
     JARO = 2
     JARO_WINKLER = 3    
 
+
+class SearchMode(Enum):
+    ADDRESS = 1
+    MESHBLOCK = 2
+    STREET = 3
+
+
+def _get_distance_function(method):
+    """
+    Return the edit distance function of the method. rapidfuzz is
+    imported on the first address-based matching
+    """
+    from rapidfuzz import fuzz
+    from rapidfuzz.string_metric import jaro_similarity, jaro_winkler_similarity
+
+    return {
+        DistanceMethod.LEVENSHTEIN: fuzz.ratio,
+        DistanceMethod.JARO: jaro_similarity,
+        DistanceMethod.JARO_WINKLER: jaro_winkler_similarity,
+    }[method]
+
+
+# the coordinates of the representative points of the meshblock-based
+# matching, kept in the cached results to calculate their distances
+_POINT_COLUMNS = ["POINT_LATITUDE", "POINT_LONGITUDE"]
+
+
+def _normalize(address):
+    """
+    Return the upper case address without the special characters,
+    used to calculate the similarity of the addresses
+    """
+    return re.sub(r"[\W_]+", "", address.upper())
+
+
 class GeoMatcher:
+    """
+    The GeoMatcher class matches the addresses or the coordinates to the
+    addresses of the reference dataset and their regions.
+
+    Parameters
+    ----------
+    hierarchy: GeoHierarchy
+        The regional structure of the country, e.g. AUS
+    file_location: string
+        The folder of the reference dataset. If it's empty, the dataset
+        is searched in the default folder: data/[country]. The Arrow IPC
+        files of a converted dataset (see store.convert_dataset) are memory
+        mapped and used instead of the parquet files
+    cache: CoordinateCache
+        The optional cache of the coordinate-based matching results. The
+        results are reused by the points of a grid cell, see CoordinateCache
+    executor: Executor
+        The executor running the matching of the asyncio functions
+        (aget_region_by_address, etc.). If it's empty (None), the default
+        executor of the event loop is used
+    max_concurrency: integer
+        The maximum number of the asyncio matching calls running at the same
+        time per event loop. The other calls wait without blocking the loop.
+        If it's empty (None), the number is only limited by the executor
+    instrument: callable
+        The optional function called with (stage name, seconds, rows) at the
+        end of each matching stage (index scoring, parquet read, etc.),
+        e.g. StageStats. If it's empty (None), the stages aren't timed
+
+    Examples
+    --------
+    >>> matcher = GeoMatcher(AUS, cache=CoordinateCache(maxsize=50000))
+    >>> matcher = GeoMatcher(AUS, executor=ThreadPoolExecutor(8), max_concurrency=8)
+    >>> matcher = GeoMatcher(AUS, instrument=StageStats())
+    >>> matcher = GeoMatcher(AUS, "data/Australia-arrow")
+    """
 
     __slots__ = (
         "_hierarchy",
@@ -24,10 +100,43 @@ class GeoMatcher:
         "_index_data",
         "_filenames",
         "_street_code_dict",
+        "_density_grid",
+        "_meshblock_index",
+        "_meshblock_tree",
+        "_cache",
+        "_index_positions",
+        "_index_keys",
+        "_executor",
+        "_max_concurrency",
+        "_semaphores",
+        "_instrument",
+        "_regions",
+        "_dataset",
+        "_fragments",
+        "_store",
     )
 
-    def __init__(self, hierarchy, file_location=""):
+    def __init__(
+        self,
+        hierarchy,
+        file_location="",
+        cache=None,
+        executor=None,
+        max_concurrency=None,
+        instrument=None,
+    ):
         self._hierarchy = hierarchy
+        self._cache = cache
+        self._instrument = instrument
+
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("The maximum concurrency must be at least 1")
+
+        # the executor of the asyncio functions and the semaphores
+        # limiting their concurrency (one per event loop)
+        self._executor = executor
+        self._max_concurrency = max_concurrency
+        self._semaphores = weakref.WeakKeyDictionary()
 
         # if no file location provided, look for the dataset in the default folder: data/[country]
         if not file_location.strip():
@@ -47,22 +156,49 @@ class GeoMatcher:
                     f"{file_location}"
                 )
 
-        # get all the parquet filenames within the folder
-        self._filenames = glob.glob(os.path.join(self._file_location, "*.parquet"))
+        # the Arrow IPC files of a converted dataset (see store.convert_dataset)
+        # are memory mapped and used instead of the parquet files
+        self._filenames = dataset.get_address_files(
+            self._file_location, store.ARROW_EXTENSION
+        )
+        if self._filenames:
+            self._store = store.ArrowStore(self._filenames)
+            self._dataset = None
+            self._fragments = self._store.files
+        else:
+            # get all the address parquet filenames within the folder
+            self._filenames = dataset.get_address_files(self._file_location)
+            self._store = None
+
+            # the dataset of the address files is kept for all the queries, its
+            # fragments (files) keep their metadata and row group statistics
+            # once read, to skip the row groups that don't match a filter
+            self._dataset = ds.dataset(
+                self._filenames,
+                format="parquet",
+                filesystem=fs.LocalFileSystem(use_mmap=True),
+            )
+            self._fragments = {
+                os.path.basename(fragment.path): fragment
+                for fragment in self._dataset.get_fragments()
+            }
 
         # init
-        index_file = "index.parquet"
+        index_file = dataset.INDEX_FILE
 
         # check if the index file exists
-        if os.path.join(self._file_location, index_file) not in self._filenames:
+        if not os.path.isfile(os.path.join(self._file_location, index_file)):
             raise ValueError(
                 f"Index file ({index_file}) can't be found in: {self._file_location}"
             )
 
-        # read the index file
-        self._index_data = pd.read_parquet(
-            os.path.join(self._file_location, index_file)
-        )
+        # read the index file (the columns used by the matching only)
+        self._index_data = dataset.read_index(self._file_location)
+
+        # the lookup of the exact address and the normalized index addresses
+        # are created on the first address-based matching
+        self._index_positions = None
+        self._index_keys = None
 
         # check the availability of required column name
         idx_columns = ["IDX", "ADDRESS", "FILE_NAME"]
@@ -72,22 +208,38 @@ class GeoMatcher:
                 f"{str(set(idx_columns) - set(self._index_data.columns))}"
             )
 
-        # remove index file from the lists
-        self._filenames.remove(os.path.join(self._file_location, index_file))
-
         # check parquet file schema (ensure all of the required columns are exist)
         # get the regions that users selected
         all_regions = self._hierarchy.get_regions_by_name(attribute="col_name")
         all_columns = list(filter(None, all_regions))
 
-        for file in self._filenames:
-            pq_columns = pq.read_schema(file).names
+        # the regions of the normalized layout (None if the address files
+        # store the region columns), joined to the matched addresses on output
+        self._regions = dataset.read_regions(self._file_location)
+
+        for file, fragment in self._fragments.items():
+            pq_columns = fragment.physical_schema.names
+            if self._regions is not None:
+                if dataset.REGION_KEY not in pq_columns:
+                    raise ValueError(
+                        f"The region key ({dataset.REGION_KEY}) can't be found "
+                        f"in the parquet file: {file}"
+                    )
+                pq_columns = pq_columns + self._regions.column_names
             if not set(all_columns).issubset(pq_columns):
                 raise ValueError(
                     f"The required columns {str(set(all_columns) - set(pq_columns))}"
                     f" can't be found in the parquet file: {file}"
                 )
 
+        # read the grid of the address counts (optional), to estimate the
+        # initial search radius of the coordinate-based matching
+        self._density_grid = dataset.read_density_grid(self._file_location)
+
+        # the meshblock index is loaded on the first region-only search
+        self._meshblock_index = None
+        self._meshblock_tree = None
+
         # define the dictionary for street code normalization
         self._street_code_dict = {
             "ALLY": "ALLEY",
@@ -127,6 +279,23 @@ class GeoMatcher:
             "WAY": "WAY",
         }
 
+    @property
+    def instrument(self):
+        """
+        Return the function called at the end of each matching stage
+        """
+        return self._instrument
+
+    @instrument.setter
+    def instrument(self, instrument):
+        self._instrument = instrument
+
+    def _stage(self, name):
+        """
+        Return the context manager timing a matching stage
+        """
+        return Stage(self._instrument, name)
+
     def _remove_street_number(self, address):
         """
         Remove the street number, lot/unit/level number, or similar attributes
@@ -142,16 +311,7 @@ class GeoMatcher:
             An address without the street number
         """
 
-        # initiate the result
-        no_number_address = address
-        while True:
-            match = re.search(r"[0-9]+[a-zA-Z,]*\s", address)
-            if not match:
-                break
-
-            pos = match.span()[1]
-            address = address[pos:]
-            no_number_address = address.upper()
+        no_number_address = self._split_street_number(address)[1]
 
         # change to upper case
         no_number_address = no_number_address.replace(",", "").strip().upper()
@@ -169,6 +329,46 @@ class GeoMatcher:
                 [self._street_code_dict.get(item, item) for item in address_parts]
             )
 
+    def _get_file_columns(self, columns):
+        """
+        Return the columns to be read from the address files. In the
+        normalized layout, the region columns are replaced by the region key
+        """
+        if self._regions is None:
+            return columns
+
+        region_columns = set(self._regions.column_names)
+        return list(
+            dict.fromkeys(
+                [column for column in columns if column not in region_columns]
+                + [dataset.REGION_KEY]
+            )
+        )
+
+    def _join_regions(self, addresses, columns):
+        """
+        Return the addresses with the columns, joining the regions
+        in the normalized layout
+        """
+        if self._regions is None:
+            return addresses
+
+        return dataset.join_regions(addresses, self._regions, columns)
+
+    def _split_street_number(self, address):
+        """
+        Split the address into the street number part (including the
+        lot/unit/level number) and the rest of the address
+        """
+        rest = address
+        while True:
+            match = re.search(r"[0-9]+[a-zA-Z,]*\s", rest)
+            if not match:
+                break
+            rest = rest[match.span()[1] :]
+
+        return address[: len(address) - len(rest)], rest
+
     def _cleaning_match_with_index(self, no_number_address):
         """
         Return similar addresses of the no_number_address with
@@ -425,6 +625,70 @@ class GeoMatcher:
          'FULL_ADDRESS': ['2885 DARNLEY STREET BRAYBROOK VIC 3019']}
         """
 
+        return self.get_regions_by_address(
+            [address],
+            similarity_threshold=similarity_threshold,
+            nlargest=nlargest,
+            regions=regions,
+            operator=operator,
+            address_cleaning=address_cleaning,
+            method=method,
+        )[0]
+
+    def get_regions_by_address(
+        self,
+        addresses,
+        similarity_threshold=0.9,
+        nlargest=1,
+        regions=None,
+        operator=None,
+        address_cleaning=False,
+        method=DistanceMethod.LEVENSHTEIN,
+    ):
+        """
+        perform address based matching for a list of addresses in a single
+        pass: all the addresses are scored against the index at once,
+        and each address file is read once for all the addresses stored in it.
+
+        Parameters
+        ----------
+        addresses:list
+            The list of complete physical addresses
+        similarity_threshold:float
+            The minimum similarity ratio ranges between 0 and 1 (default = 0.9)
+        nlargest:int
+            The number of the addresses to be returned for each address
+            (default = 1)
+        regions:string or list of string
+            Specify the name or list of names of the regions to be returned by the function
+        operator: Operator
+            use the operator (Operator.ge or Operator.le) to find all the 
+            upper/lower level regions from a particular region name.
+        address_cleaning:boolean
+            whether to perform data cleansing on the addresses,
+            see get_region_by_address
+        method:string
+            The name of the edit distance algorithm used.
+            Select one of DistanceMethod.LEVENSHTEIN,DistanceMethod.JARO, 
+            or DistanceMethod.JARO_WINKLER
+        
+        Returns
+        -------
+        list
+            the list of dictionaries returned by get_region_by_address,
+            in the same order as the input addresses
+        
+        Examples
+        --------
+        >>> matcher = GeoMatcher(AUS)
+        >>> matched = matcher.get_regions_by_address(
+                ["2885 Darnley Street, Braybrook, VIC 3019",
+                 "9121, George Street, North Strathfield, NSW 2137"],
+                regions="SA2")
+        >>> [match["SA2_NAME_2016"] for match in matched]
+        [['Braybrook'], ['Concord West - North Strathfield']]
+        """
+
         if not isinstance(method, DistanceMethod):
             raise ValueError(
                 f"String metric is unknown. Select one of {[e.value for e in DistanceMethod]}"
@@ -435,139 +699,342 @@ class GeoMatcher:
 
         if nlargest < 1:
             raise ValueError("The number of returned records must be at least 1")
-            
-        #list of functions
-        dist_functions = {DistanceMethod.LEVENSHTEIN: fuzz.ratio,
-                          DistanceMethod.JARO: jaro_similarity,
-                          DistanceMethod.JARO_WINKLER: jaro_winkler_similarity}
 
-        # initiate the result
-        addresses = pd.DataFrame()
+        if (self._index_data is None) or (self._index_data.shape[0] == 0):
+            raise ValueError(
+                "No index records found. Make sure the initiation process is succeeded"
+            )
 
-        clean_address = self._remove_street_number(address)
+        # 1. remove the street number (and perform further cleaning)
+        with self._stage("remove_street_number") as stage:
+            clean_addresses = [
+                self._remove_street_number(address) for address in addresses
+            ]
+            stage.rows = len(clean_addresses)
 
         if address_cleaning:
-            # perform further cleaning
-            clean_address = self._cleaning_address(clean_address)
+            with self._stage("cleaning_address") as stage:
+                clean_addresses = [
+                    self._cleaning_address(clean_address)
+                    for clean_address in clean_addresses
+                ]
+                stage.rows = len(clean_addresses)
 
-        # print(clean_address)
+        # 2. match the clean addresses with the index
+        # (the position of the matched index row, or None if not similar)
+        positions = self._match_index(clean_addresses, similarity_threshold, method)
 
-        # match with the index
-        if (self._index_data is not None) and (self._index_data.shape[0] > 0):
-            # no clean address found
-            clean_address_idx = self._index_data[
-                self._index_data["ADDRESS"] == clean_address
-            ]
+        # 3. read the matched streets (IDX) of the address files,
+        # only the columns of the regions that users selected
+        selected_columns = ["FULL_ADDRESS"] + self._get_region_columns(
+            regions, operator
+        )
+        read_columns = self._get_file_columns(selected_columns)
+        matched_index = self._index_data.iloc[
+            [position for position in positions if position is not None]
+        ]
+        blocks = self._read_address_blocks(
+            matched_index.groupby("FILE_NAME", observed=True)["IDX"].unique(),
+            read_columns,
+        )
 
-            if clean_address_idx.shape[0] == 0:
-                # calculate the distance (Levenshtein Distance) between the
-                # input address (without street number) and the index
-                # [all special characters are removed]
-                
-                self._index_data["RATIO"] = self._index_data["ADDRESS"].apply(
-                    lambda x: dist_functions[method](
-                        re.sub(r"[\W_]+", "", clean_address),
-                        re.sub(r"[\W_]+", "", x.upper()),
+        # 4. calculate the similarity (e.g. Levenshtein Distance) between
+        # the input addresses (with street number) and the addresses
+        # of the matched streets [all special characters are removed]
+        score = _get_distance_function(method)
+        matches = []
+        with self._stage("address_scoring") as stage:
+            for address, position in zip(addresses, positions):
+                if position is None:
+                    matches.append(None)
+                    continue
+
+                block = blocks[
+                    (
+                        self._index_data["FILE_NAME"].iat[position],
+                        self._index_data["IDX"].iat[position],
                     )
-                    / 100.0
+                ]
+                address_key = _normalize(address)
+                ratios = pd.Series(
+                    [score(address_key, key) / 100.0 for key in block["KEY"]],
+                    index=block.index,
+                    dtype=float,
                 )
+                stage.rows += block.shape[0]
 
-                # get the index with the largest similarity
-                largest_idx = self._index_data.nlargest(1, "RATIO")
+                # if similarity score is larger then the threshold,
+                # there is a possibility the addresses are similar.
+                # Keep the addresses with the highest score
+                similar = block.loc[ratios >= similarity_threshold, read_columns]
+                similar["RATIO"] = ratios[ratios >= similarity_threshold]
+                matches.append(
+                    self._join_regions(
+                        similar.nlargest(nlargest, "RATIO"),
+                        selected_columns + ["RATIO"],
+                    )
+                )
+                stats.record(
+                    "address_scoring",
+                    {
+                        "address": address,
+                        "rows_scored": block.shape[0],
+                        "best_ratio": ratios.max() if block.shape[0] else None,
+                        "rows_above_threshold": similar.shape[0],
+                    },
+                )
 
-                if largest_idx["RATIO"].values[0] < similarity_threshold:
-                    return {}
+        with self._stage("result_conversion") as stage:
+            results = []
+            for similar in matches:
+                if similar is None or similar.shape[0] == 0:
+                    results.append({})
+                else:
+                    results.append(similar.to_dict(orient="list"))
+                    stage.rows += similar.shape[0]
 
-                # first, check the filename it it's available
-                parquet_filename = largest_idx["FILE_NAME"].values[0]
-                parquet_idx = largest_idx["IDX"].values[0]
-            else:
+        return results
 
-                parquet_filename = clean_address_idx["FILE_NAME"].values[0]
-                parquet_idx = clean_address_idx["IDX"].values[0]
+    def _match_index(self, clean_addresses, similarity_threshold, method):
+        """
+        Match the clean addresses (without the street number) with the index.
+        The addresses that can't be found in the index are scored against
+        all the index addresses at once.
 
-            if os.path.isfile(os.path.join(self._file_location, parquet_filename)):
-                # read the parquet file where the IDX and address are stored
-                address_parquet = pq.read_table(
-                    os.path.join(self._file_location, parquet_filename),
-                    filesystem=fs.LocalFileSystem(),
-                    filters=[("IDX", "=", parquet_idx)],
-                ).to_pandas()
+        Parameters
+        ----------
+        clean_addresses:list
+            The addresses without the street number
+        similarity_threshold:float
+            The minimum similarity ratio ranges between 0 and 1
+        method:DistanceMethod
+            The edit distance algorithm used
 
-                # calculate the distance (Levenshtein Distance) between the
-                # input address (with street number) and the entire addresses
-                # reference dataset
-                # [all special characters are removed]
-                
-                address_parquet["RATIO"] = address_parquet["FULL_ADDRESS"].apply(
-                    lambda x: dist_functions[method](
-                        re.sub(r"[\W_]+", "", address.upper()),
-                        re.sub(r"[\W_]+", "", x.upper()),
-                    )
-                    / 100.0
+        Returns
+        -------
+        list
+            The positions of the matched index rows, or None for the
+            addresses whose highest similarity is below the threshold
+        """
+        # first, look for the exact address in the index
+        if self._index_positions is None:
+            addresses = self._index_data["ADDRESS"].values
+            # keep the first row of the duplicated addresses
+            self._index_positions = dict(
+                zip(addresses[::-1], range(len(addresses) - 1, -1, -1))
+            )
+        with self._stage("exact_lookup") as stage:
+            positions = [
+                self._index_positions.get(address) for address in clean_addresses
+            ]
+            stage.rows = len(positions)
+
+        for address, position in zip(clean_addresses, positions):
+            if position is not None:
+                stats.record(
+                    "index_lookup",
+                    {
+                        "address": address,
+                        "exact": True,
+                        "rows_scored": 0,
+                        "position": position,
+                        "candidates": [],
+                    },
                 )
 
-                # if similarity score is larger then the threshold,
-                # there is a possibility the addresses are similar
-                # will need to select the highest score later on
-                addresses = address_parquet[
-                    address_parquet["RATIO"] >= similarity_threshold
-                ]
+        # calculate the similarity of the remaining (unique) addresses
+        # with all the index addresses [all special characters are removed]
+        unmatched = list(
+            dict.fromkeys(
+                address
+                for address, position in zip(clean_addresses, positions)
+                if position is None
+            )
+        )
+        if not unmatched:
+            return positions
+
+        if self._index_keys is None:
+            self._index_keys = [
+                _normalize(address) for address in self._index_data["ADDRESS"].values
+            ]
 
-                # get the regions that users selected
-                selected_regions = self._hierarchy.get_regions_by_name(
-                    region_names = regions, operator=operator
+        from rapidfuzz import process
+
+        matched = {}
+        with self._stage("index_scoring") as stage:
+            # limit the size of the similarity matrix
+            chunk_size = max(1, 2 ** 22 // len(self._index_keys))
+            for start in range(0, len(unmatched), chunk_size):
+                chunk = unmatched[start : start + chunk_size]
+                ratios = process.cdist(
+                    [_normalize(address) for address in chunk],
+                    self._index_keys,
+                    scorer=_get_distance_function(method),
+                    workers=-1,
                 )
+                for address, address_ratios in zip(chunk, ratios):
+                    # get the index with the largest similarity
+                    position = int(np.argmax(address_ratios))
+                    matched[address] = (
+                        position
+                        if address_ratios[position] / 100.0 >= similarity_threshold
+                        else None
+                    )
+                    if stats.current_trace() is not None:
+                        stats.record(
+                            "index_lookup",
+                            {
+                                "address": address,
+                                "exact": False,
+                                "rows_scored": len(self._index_keys),
+                                "position": matched[address],
+                                "candidates": self._get_candidates(address_ratios),
+                            },
+                        )
+            stage.rows = len(unmatched) * len(self._index_keys)
 
-                # get the columns only
-                selected_columns = []
-                for reg in selected_regions:
-                    if reg not in selected_columns:
-                        selected_columns.append(reg.col_name)
+        return [
+            matched[address] if position is None else position
+            for address, position in zip(clean_addresses, positions)
+        ]
 
-                # deleted later
-                selected_columns.append("FULL_ADDRESS")
-                selected_columns.append("RATIO")
+    def _get_candidates(self, ratios, count=5):
+        """
+        Return the index rows with the highest similarity ratios
+        (used to explain the address-based matching)
+        """
+        positions = np.argsort(-ratios, kind="stable")[:count]
+        return [
+            {
+                "position": int(position),
+                "IDX": self._index_data["IDX"].iat[position],
+                "FILE_NAME": self._index_data["FILE_NAME"].iat[position],
+                "ADDRESS": self._index_data["ADDRESS"].iat[position],
+                "RATIO": ratios[position] / 100.0,
+            }
+            for position in positions
+        ]
 
-                # remove empty element, if exists
-                selected_columns = list(filter(None, selected_columns))
-                selected_columns = list(set(selected_columns))
+    def _read_address_blocks(self, file_streets, columns):
+        """
+        Read the addresses of the streets (IDX) from the address files,
+        one read per file
 
-                # if there are possible similar address found
-                if addresses.shape[0] > 0:
-                    # return the most similar address only
-                    if nlargest == 1:
+        Parameters
+        ----------
+        file_streets:Series or dictionary
+            The list of IDX to be read, by the file name
+        columns:list
+            The columns to be read
 
-                        # sort the addresses based on the similarity score
-                        addresses = addresses.sort_values(
-                            by="RATIO", ascending=False
-                        ).reset_index(drop=True)
+        Returns
+        -------
+        dictionary
+            The addresses (with the normalized FULL_ADDRESS in the KEY column)
+            by (file name, IDX)
+        """
+        blocks = {}
+        for filename, streets in file_streets.items():
+            if filename not in self._fragments:
+                raise ValueError(f"The address file can't be found: {filename}")
+
+            with self._stage("parquet_read") as stage:
+                address_parquet = self._read_streets(
+                    filename, list(streets), list(dict.fromkeys(columns + ["IDX"]))
+                ).to_pandas()
+                stage.rows = address_parquet.shape[0]
+            stats.record(
+                "parquet_read",
+                {"file": filename, "idx": list(streets), "rows": address_parquet.shape[0]},
+            )
 
-                        return addresses.head(1)[selected_columns].to_dict(
-                            orient="list"
-                        )
+            address_parquet["KEY"] = [
+                _normalize(address) for address in address_parquet["FULL_ADDRESS"]
+            ]
 
-                    # return all the similar addresses
-                    else:
+            for idx, block in address_parquet.groupby("IDX"):
+                blocks[(filename, idx)] = block
 
-                        return (
-                            addresses[selected_columns]
-                            .nlargest(nlargest, "RATIO")
-                            .sort_values(by="RATIO", ascending=False)
-                            .to_dict(orient="list")
-                        )
-                else:
-                    return {}
+        return blocks
 
-            else:
-                raise ValueError(f"The address file can't be found: {parquet_filename}")
+    def _read_streets(self, filename, streets, columns):
+        """
+        Read the addresses of the streets (IDX) from an address file
 
-        else:
-            raise ValueError(
-                "No index records found. Make sure the initiation process is succeeded"
-            )
+        Parameters
+        ----------
+        filename:string
+            The name of the address file
+        streets:list
+            The IDX of the streets
+        columns:list
+            The columns to be read
 
-    def _load_parquet(self, lat, lon, distance):
+        Returns
+        -------
+        pyarrow.Table
+            The addresses of the streets
+        """
+        if self._store is not None:
+            return self._store.read_streets(filename, streets, columns)
+
+        return self._fragments[filename].to_table(
+            columns=columns, filter=ds.field("IDX").isin(streets)
+        )
+
+    def _scanner(self, bounds, columns=None, filter=None, **kwargs):
+        """
+        Return the scanner of the address files
+
+        Parameters
+        ----------
+        bounds:tuple
+            The box containing the filtered addresses (min latitude,
+            max latitude, min longitude, max longitude), the batches of the
+            Arrow files outside of the box are skipped
+        columns:list
+            The columns to be read. If it's empty (None), read all columns
+        filter:pyarrow.dataset.Expression
+            The filter of the addresses
+        **kwargs: dict, optional
+            The other options of the scanner, e.g. batch_size
+
+        Returns
+        -------
+        pyarrow.dataset.Scanner
+            The scanner of the addresses
+        """
+        if self._store is not None:
+            return self._store.scanner(*bounds, columns=columns, filter=filter, **kwargs)
+
+        return self._dataset.scanner(columns=columns, filter=filter, **kwargs)
+
+    def _get_region_columns(self, regions=None, operator=None):
+        """
+        Return the column names of the regions that users selected
+
+        Parameters
+        ----------
+        regions:string or list of string
+            The name or list of names of the regions
+        operator: Operator
+            The operator (Operator.ge or Operator.le) to find all the
+            upper/lower level regions from a particular region name
+
+        Returns
+        -------
+        list
+            The unique column names, in the order of the hierarchy
+        """
+        col_names = self._hierarchy.get_regions_by_name(
+            region_names=regions, operator=operator, attribute="col_name"
+        )
+
+        # remove empty and duplicate elements, if exist
+        return list(dict.fromkeys(filter(None, col_names)))
+
+    def _load_parquet(self, lat, lon, distance, inner_distance=0, columns=None):
         """
         load the rows in the parquet file meeting the condition
         the condition is to ensure the LATITUDE and LONGITUDE are within a distance from the
@@ -581,34 +1048,249 @@ class GeoMatcher:
             longitude
         distance:integer
                 define what the minimum km of distance from the argument lat and lon
+        inner_distance:float
+                the distance of the box that has been loaded previously.
+                If it's larger than 0, only the ring between the inner box and
+                the outer box will be loaded (default = 0)
+        columns:list
+                the columns to be read. If it's empty (None), read all columns
         
         Returns
         -------
         a panda dataframe
         """
 
-        local = fs.LocalFileSystem()
-        df = pq.read_table(
-            self._filenames,
-            filesystem=local,
-            filters=[
-                ("LATITUDE", ">=", lat - distance),
-                ("LATITUDE", "<=", lat + distance),
-                ("LONGITUDE", ">=", lon - distance),
-                ("LONGITUDE", "<=", lon + distance),
-            ],
-        ).to_pandas()
+        box = self._box_filter(lat, lon, distance)
+        if inner_distance > 0:
+            # only the ring around the inner box is loaded
+            box = box & ~self._box_filter(lat, lon, inner_distance)
+
+        with self._stage("load_parquet") as stage:
+            # the files are scanned in parallel, the row groups outside of
+            # the box are skipped based on their statistics
+            df = (
+                self._scanner(
+                    (lat - distance, lat + distance, lon - distance, lon + distance),
+                    columns=columns,
+                    filter=box,
+                    use_threads=True,
+                )
+                .to_table()
+                .to_pandas()
+            )
+            stage.rows = df.shape[0]
+
+        # 1 lat equals 110.574km
+        stats.record(
+            "parquet_load",
+            {
+                "km": distance * 110.574,
+                "inner_km": inner_distance * 110.574,
+                "rows": df.shape[0],
+            },
+        )
 
         return df
 
+    def _box_filter(self, lat, lon, distance):
+        """
+        Return the filter expression of the addresses within the box
+        of the distance (in degrees) around the coordinates
+        """
+        return (
+            (ds.field("LATITUDE") >= lat - distance)
+            & (ds.field("LATITUDE") <= lat + distance)
+            & (ds.field("LONGITUDE") >= lon - distance)
+            & (ds.field("LONGITUDE") <= lon + distance)
+        )
+
+    def _covers_boundary(self, lat, lon, distance):
+        """
+        Check whether the box of +/- distance degrees around the coordinates
+        covers the country's geo boundary, i.e. expanding the box will not
+        find any more addresses
+        """
+        min_lat, max_lat, min_lon, max_lon = self._hierarchy.coordinate_boundary
+        return (
+            lat - distance <= min_lat
+            and lat + distance >= max_lat
+            and lon - distance <= min_lon
+            and lon + distance >= max_lon
+        )
+
+    def _get_region_by_meshblock(self, lat, lon, n, region_columns, points=False):
+        """
+        Find the n nearest smallest regional units (e.g. meshblocks) based
+        on their representative points, and return the units' regions
+        without searching for the addresses
+
+        Parameters
+        ----------
+        lat:float
+            latitude
+        lon:float
+            longitude
+        n:integer
+            the number of nearest units to be returned
+        region_columns:list
+            the columns of the regions to be returned
+        points:boolean
+            whether to return the coordinates of the nearest representative
+            point of the units (POINT_LATITUDE and POINT_LONGITUDE)
+
+        Returns
+        -------
+        Dictionary
+            a dictionary of the regions and the distance (km) to the
+            nearest representative point of the units
+        """
+        # load the meshblock index and build its Ball Tree once
+        if self._meshblock_tree is None:
+            meshblocks = dataset.read_meshblock_index(self._file_location)
+            if meshblocks is None:
+                raise ValueError(
+                    f"Meshblock index ({dataset.MESHBLOCK_FILE}) can't be found in: "
+                    f"{self._file_location}"
+                )
+            self._meshblock_index = meshblocks
+            self._meshblock_tree = spatial.ball_tree(
+                meshblocks["LATITUDE"].values, meshblocks["LONGITUDE"].values
+            )
+
+        # a unit has several representative points. Querying
+        # n * MESHBLOCK_POINTS points ensures that n units are found
+        with self._stage("meshblock_query") as stage:
+            distances, indices = self._meshblock_tree.query(
+                np.deg2rad(np.c_[lat, lon]),
+                k=min(n * dataset.MESHBLOCK_POINTS, self._meshblock_index.shape[0]),
+            )
+            stage.rows = indices.shape[1]
+
+        with self._stage("result_conversion") as stage:
+            unit_column = self._hierarchy.get_smallest_region_boundaries().col_name
+            nearest_df = self._meshblock_index.iloc[indices[0]].copy()
+            nearest_df["DISTANCE"] = distances[0] * spatial.EARTH_RADIUS
+            nearest_df = nearest_df.drop_duplicates(unit_column).head(n)
+            stage.rows = nearest_df.shape[0]
+
+            columns = region_columns + ["DISTANCE"]
+            if points:
+                nearest_df[_POINT_COLUMNS] = nearest_df[["LATITUDE", "LONGITUDE"]]
+                columns += _POINT_COLUMNS
+            return nearest_df[columns].to_dict(orient="list")
+
+    def _get_address_by_street(self, lat, lon, n, columns):
+        """
+        Find the n nearest addresses by searching for the nearby streets first.
+        The streets (IDX) are visited in the order of the distance between
+        the input coordinates and their bounding box (stored in the index).
+        The addresses of the streets are read with the IDX filter until
+        the n-th nearest address found is not further than the bounding box
+        of any remaining street.
+
+        Parameters
+        ----------
+        lat:float
+            latitude
+        lon:float
+            longitude
+        n:integer
+            the number of nearest addresses to be returned
+        columns:list
+            the columns to be read from the address files
+
+        Returns
+        -------
+        DataFrame
+            the nearest addresses with their distance (km), sorted by the distance
+        """
+        bbox_columns = ["MIN_LATITUDE", "MAX_LATITUDE", "MIN_LONGITUDE", "MAX_LONGITUDE"]
+        if not set(bbox_columns).issubset(self._index_data.columns):
+            raise ValueError(
+                f"The street bounding boxes {bbox_columns} can't be found in "
+                f"the index file. Add them with dataset.add_street_centroids"
+            )
+
+        streets = self._index_data.dropna(subset=bbox_columns)
+
+        # the distance to the nearest point of each street's bounding box
+        with self._stage("street_ranking") as stage:
+            lower_bounds = spatial.haversine(
+                lat,
+                lon,
+                np.clip(lat, streets["MIN_LATITUDE"].values, streets["MAX_LATITUDE"].values),
+                np.clip(lon, streets["MIN_LONGITUDE"].values, streets["MAX_LONGITUDE"].values),
+            )
+            order = np.argsort(lower_bounds, kind="stable")
+            lower_bounds = lower_bounds[order] * spatial.EARTH_RADIUS
+            stage.rows = len(order)
+        address_counts = (
+            streets["ADDRESS_COUNT"].values[order]
+            if "ADDRESS_COUNT" in streets.columns
+            else np.ones(len(order))
+        )
+
+        # the first round reads enough streets to get n addresses
+        count = int(np.searchsorted(np.cumsum(address_counts), n)) + 1
+        position = 0
+        nearest_df = pd.DataFrame()
+        while count > 0 and position < len(order):
+            next_streets = streets.iloc[order[position : position + count]]
+            position += count
+
+            street_dfs = [nearest_df]
+            for filename, file_streets in next_streets.groupby("FILE_NAME", observed=True):
+                with self._stage("parquet_read") as stage:
+                    street_dfs.append(
+                        self._read_streets(
+                            filename, file_streets["IDX"].tolist(), columns
+                        ).to_pandas()
+                    )
+                    stage.rows = street_dfs[-1].shape[0]
+                stats.record(
+                    "parquet_read",
+                    {
+                        "file": filename,
+                        "idx": file_streets["IDX"].tolist(),
+                        "rows": street_dfs[-1].shape[0],
+                    },
+                )
+
+            # keep the n nearest addresses only
+            nearest_df = pd.concat(street_dfs, ignore_index=True)
+            nearest_df["DISTANCE"] = (
+                spatial.haversine(
+                    lat, lon, nearest_df["LATITUDE"].values, nearest_df["LONGITUDE"].values
+                )
+                * spatial.EARTH_RADIUS
+            )
+            nearest_df = nearest_df.nsmallest(n, "DISTANCE")
+
+            if nearest_df.shape[0] >= n:
+                # only the streets whose bounding box is nearer than the n-th
+                # address found can have nearer addresses. Read all of them
+                # in the next round (none left means the search is complete)
+                count = (
+                    np.searchsorted(
+                        lower_bounds, nearest_df["DISTANCE"].iloc[-1], side="left"
+                    )
+                    - position
+                )
+            else:
+                # not enough addresses, read twice as many streets
+                count *= 2
+
+        return nearest_df.sort_values("DISTANCE")
+
     def get_region_by_coordinates(
         self, 
         lat, 
         lon, 
         n=1, 
-        km=1, 
+        km=None, 
         regions=None, 
-        operator=None
+        operator=None,
+        mode=SearchMode.ADDRESS,
     ):
         """
         perform coordinate_based matching and return the corresponding regions in a dictionary
@@ -624,7 +1306,24 @@ class GeoMatcher:
             the number of nearest addresses to be returned by the function.
         km:integer
             the nearest addresses will be searched from the input coordinates
-            point within the argument kilometer radius
+            point within the argument kilometer radius.
+            If it's empty (None), the initial radius is estimated from the
+            density grid of the dataset to contain about n addresses
+            (or 1 km if the dataset doesn't have the density grid)
+        regions:string or list of string
+            Specify the name or list of names of the regions to be returned by the function
+        operator: Operator
+            use the operator (Operator.ge or Operator.le) to find all the 
+            upper/lower level regions from a particular region name.
+        mode:SearchMode
+            SearchMode.ADDRESS searches for the nearest addresses.
+            SearchMode.MESHBLOCK searches for the nearest meshblocks (the smallest
+            regional unit) from the meshblock index and only returns the regions,
+            which is faster and uses less memory. In this mode, n is the number
+            of meshblocks and km is not used.
+            SearchMode.STREET searches for the nearest streets from their
+            bounding boxes in the index first, then reads the addresses of
+            those streets only. km is not used. (default = SearchMode.ADDRESS)
         
         Returns
         -------
@@ -650,11 +1349,18 @@ class GeoMatcher:
          'SA1_7DIGITCODE_2016': ['3142707'],
          'MB_CODE_2016': ['30563074700'],
          'DISTANCE': [0.0016422183328786543]}
+        >>> matcher.get_region_by_coordinates(-26.657299, 153.094955,
+                                              regions=["SA2", "LGA"],
+                                              mode=SearchMode.MESHBLOCK)
+        {'LGA_NAME_2016': ['Sunshine Coast (R)'],
+         'SA2_NAME_2016': ['Maroochydore - Kuluin'],
+         'DISTANCE': [0.0384411526412133]}
         """
 
-        min_distance = 0
-        # 1 lat equals 110.574km
-        distance = (km if km else 1) / 110.574
+        if not isinstance(mode, SearchMode):
+            raise ValueError(
+                f"Search mode is unknown. Select one of {[e.value for e in SearchMode]}"
+            )
 
         # 1. Ensure lat/lon within the country's geo boundary range
         if len(self._hierarchy.coordinate_boundary) != 4:
@@ -671,64 +1377,601 @@ class GeoMatcher:
         )
         if not within_range:
             raise ValueError(
-                "The latitude input should be within "
-                + self._hierarchy.coordinate_boundary[0]
-                + "and"
-                + self._hierarchy.coordinate_boundary[1]
-                + " and longitude input must be within  "
-                + self._hierarchy.coordinate_boundary[2]
-                + "and"
-                + self._hierarchy.coordinate_boundary[3]
+                f"The latitude input should be within "
+                f"{self._hierarchy.coordinate_boundary[0]} and "
+                f"{self._hierarchy.coordinate_boundary[1]} and longitude input must be within "
+                f"{self._hierarchy.coordinate_boundary[2]} and "
+                f"{self._hierarchy.coordinate_boundary[3]}"
             )
 
+        # 1.a Return the cached result of the same grid cell, if exists
+        if self._cache is not None:
+            key = self._cache.make_key(lat, lon, n, km, regions, operator, mode)
+            matched = self._cache.get(key)
+            stats.record("cache", "miss" if matched is None else "hit")
+            if matched is None:
+                matched = self._match_coordinates(
+                    lat, lon, n, km, regions, operator, mode, points=True
+                )
+                self._cache.put(key, matched)
+            else:
+                # the matched addresses (or units) are shared by the points
+                # of the cell, their distances are the distances of this point
+                latitudes, longitudes = (
+                    (matched["POINT_LATITUDE"], matched["POINT_LONGITUDE"])
+                    if mode == SearchMode.MESHBLOCK
+                    else (matched["LATITUDE"], matched["LONGITUDE"])
+                )
+                distances = (
+                    spatial.haversine(lat, lon, latitudes, longitudes)
+                    * spatial.EARTH_RADIUS
+                )
+
+                # sorted by the distances of this point, as a cache miss
+                order = np.argsort(distances, kind="stable")
+                matched = {
+                    column: [values[position] for position in order]
+                    for column, values in matched.items()
+                }
+                matched["DISTANCE"] = distances[order].tolist()
+
+            for column in _POINT_COLUMNS:
+                matched.pop(column, None)
+            return matched
+
+        return self._match_coordinates(lat, lon, n, km, regions, operator, mode)
+
+    def _match_coordinates(self, lat, lon, n, km, regions, operator, mode, points=False):
+        """
+        Search for the nearest addresses (or meshblocks) of the coordinates.
+        See get_region_by_coordinates for the parameters, and
+        _get_region_by_meshblock for points.
+        """
+
+        if mode == SearchMode.MESHBLOCK:
+            return self._get_region_by_meshblock(
+                lat, lon, n, self._get_region_columns(regions, operator), points
+            )
+
+        # only read the columns to be returned
+        selected_columns = [
+            "FULL_ADDRESS",
+            "LATITUDE",
+            "LONGITUDE",
+        ] + self._get_region_columns(regions, operator)
+
+        read_columns = self._get_file_columns(selected_columns)
+
+        if mode == SearchMode.STREET:
+            return self._join_regions(
+                self._get_address_by_street(lat, lon, n, read_columns),
+                selected_columns + ["DISTANCE"],
+            ).to_dict(orient="list")
+
+        # 1.b Pick the initial radius
+        if km is None and self._density_grid is not None:
+            distance = self._density_grid.distance_for(lat, lon, n)
+            stats.record("initial_radius", "density_grid")
+        else:
+            # 1 lat equals 110.574km
+            distance = (km if km else 1) / 110.574
+            stats.record("initial_radius", "km" if km else "default")
+
         # 2. Make the first load of GNAF dataset
-        gnaf_df = self._load_parquet(lat, lon, distance)
-
-        # 2.a If the desired count of addresses not exist, increase the radius
-        while gnaf_df.shape[0] < n:
-            min_distance = distance
-            distance *= 2
-
-            gnaf_df = self._load_parquet(lat, lon, distance)
-
-        # 2.b Keep reducing the size of rows if more than 10k adddresses
-        # are found within the radius
-        # Take the median distance to reduce
-        # This is to limit the number of datapoint to build the Ball tree in the next step
-        while gnaf_df.shape[0] >= n + 10000:
-            middle_distance = (distance - min_distance) / 2
-
-            temp_df = gnaf_df[
-                gnaf_df.LATITUDE.between(lat - middle_distance, lat + middle_distance)
-                & gnaf_df.LONGITUDE.between(
-                    lon - middle_distance, lon + middle_distance
+        gnaf_df = self._load_parquet(lat, lon, distance, columns=read_columns)
+
+        # 2.a If the desired count of addresses not exist, increase the radius.
+        # Only the ring around the previous box is loaded, the addresses
+        # within the previous box are kept
+        while gnaf_df.shape[0] < n and not self._covers_boundary(lat, lon, distance):
+            with self._stage("radius_iteration") as stage:
+                ring_df = self._load_parquet(
+                    lat, lon, distance * 2, distance, read_columns
                 )
-            ]
-            # If no record are found, quit the iteration
-            if temp_df.shape[0] < 1:
+                gnaf_df = pd.concat([gnaf_df, ring_df], ignore_index=True)
+                distance *= 2
+                stage.rows = ring_df.shape[0]
+            stats.record("radius_doubling", distance * 110.574)
+
+        if gnaf_df.shape[0] == 0:
+            return {}
+
+        while True:
+            # 2.b If more than 10k adddresses are found within the radius,
+            # keep the addresses that are not further than the n-th nearest one.
+            # This is to limit the number of datapoint to build the Ball tree
+            # in the next step
+            if gnaf_df.shape[0] >= n + 10000:
+                geo_distances = spatial.haversine(
+                    lat, lon, gnaf_df["LATITUDE"].values, gnaf_df["LONGITUDE"].values
+                )
+                nth_distance = np.partition(geo_distances, n - 1)[n - 1]
+                candidate_df = gnaf_df[geo_distances <= nth_distance]
+            else:
+                candidate_df = gnaf_df
+
+            # 3. Build the Ball Tree and Query for the nearest within k distance
+            with self._stage("balltree_build") as stage:
+                ball_tree = spatial.ball_tree(
+                    candidate_df["LATITUDE"].values, candidate_df["LONGITUDE"].values
+                )
+                stage.rows = candidate_df.shape[0]
+
+            with self._stage("balltree_query") as stage:
+                distances, indices = ball_tree.query(
+                    np.deg2rad(np.c_[lat, lon]), k=min(n, candidate_df.shape[0])
+                )
+                stage.rows = indices.shape[1]
+
+            # 3.a The addresses in the corners of the box can be further than
+            # the addresses just outside the box. If the n-th nearest address
+            # is not within the circle covered by the box, load the ring
+            # up to its distance and query again
+            if distances[0][-1] <= spatial.covered_radius(
+                lat, distance
+            ) or self._covers_boundary(lat, lon, distance):
                 break
-            gnaf_df = temp_df
-            distance = middle_distance
 
-        # 3. Build the Ball Tree and Query for the nearest within k distance
-        ball_tree = BallTree(
-            np.deg2rad(gnaf_df[["LATITUDE", "LONGITUDE"]].values), metric="haversine"
+            with self._stage("radius_iteration") as stage:
+                outer_distance = spatial.box_distance(lat, distances[0][-1])
+                ring_df = self._load_parquet(
+                    lat, lon, outer_distance, distance, read_columns
+                )
+                gnaf_df = pd.concat([gnaf_df, ring_df], ignore_index=True)
+                distance = outer_distance
+                stage.rows = ring_df.shape[0]
+            stats.record("radius_expansion", distance * 110.574)
+
+        # 4. Get the nearest addresses and calculate the distance(km)
+        with self._stage("result_conversion") as stage:
+            final_gnaf_df = candidate_df.iloc[indices[0]].copy()
+            final_gnaf_df["DISTANCE"] = distances[0] * spatial.EARTH_RADIUS
+            final_gnaf_df = self._join_regions(
+                final_gnaf_df, selected_columns + ["DISTANCE"]
+            )
+            stage.rows = final_gnaf_df.shape[0]
+
+            return final_gnaf_df.sort_values("DISTANCE").to_dict(orient="list")
+
+    def get_regions_by_coordinates(
+        self,
+        coordinates,
+        n=1,
+        km=None,
+        regions=None,
+        operator=None,
+        mode=SearchMode.ADDRESS,
+    ):
+        """
+        perform coordinate_based matching for a list of coordinates.
+        The coordinates are matched in the order of a Hilbert curve, so that
+        consecutive matches read nearby addresses (the same row groups and
+        cached pages). The results are returned in the original order.
+
+        Parameters
+        ----------
+        coordinates:list
+            the list of (latitude, longitude) pairs
+        n:integer
+            the number of nearest addresses to be returned for each coordinates
+        km:integer
+            the initial search radius, see get_region_by_coordinates
+        regions:string or list of string
+            Specify the name or list of names of the regions to be returned by the function
+        operator: Operator
+            use the operator (Operator.ge or Operator.le) to find all the 
+            upper/lower level regions from a particular region name.
+        mode:SearchMode
+            the search mode, see get_region_by_coordinates
+            (default = SearchMode.ADDRESS)
+        
+        Returns
+        -------
+        list
+            the list of dictionaries returned by get_region_by_coordinates,
+            in the same order as the input coordinates
+        
+        Examples
+        --------
+        >>> matcher = GeoMatcher(AUS)
+        >>> matched = matcher.get_regions_by_coordinates(
+                [(-26.657299, 153.094955), (-29.1789874, 152.628291)],
+                regions="SA2")
+        >>> [match["SA2_NAME_2016"] for match in matched]
+        [['Maroochydore - Kuluin'], ['Grafton Region']]
+        """
+        if len(coordinates) == 0:
+            return []
+
+        latitudes, longitudes = np.asarray(coordinates, dtype=float).T
+        order = np.argsort(
+            spatial.hilbert_index(
+                latitudes, longitudes, self._hierarchy.coordinate_boundary
+            ),
+            kind="stable",
+        )
+
+        results = [None] * len(coordinates)
+        for position in order:
+            results[position] = self.get_region_by_coordinates(
+                latitudes[position],
+                longitudes[position],
+                n=n,
+                km=km,
+                regions=regions,
+                operator=operator,
+                mode=mode,
+            )
+
+        return results
+
+    def get_addresses_within_bounds(
+        self,
+        min_latitude,
+        max_latitude,
+        min_longitude,
+        max_longitude,
+        regions=None,
+        operator=None,
+        batch_size=65536,
+    ):
+        """
+        Stream all the addresses within a bounding box and their regions.
+        The address files and their row groups that are outside of the box
+        (based on the parquet statistics) are skipped.
+
+        Parameters
+        ----------
+        min_latitude:float
+            the southern edge of the box
+        max_latitude:float
+            the northern edge of the box
+        min_longitude:float
+            the western edge of the box
+        max_longitude:float
+            the eastern edge of the box
+        regions:string or list of string
+            Specify the name or list of names of the regions to be returned by the function
+        operator: Operator
+            use the operator (Operator.ge or Operator.le) to find all the 
+            upper/lower level regions from a particular region name.
+        batch_size:integer
+            the maximum number of addresses per batch (default = 65536)
+        
+        Returns
+        -------
+        Generator
+            the pyarrow RecordBatch of the addresses (FULL_ADDRESS, LATITUDE,
+            LONGITUDE and the selected regions)
+        
+        Examples
+        --------
+        >>> matcher = GeoMatcher(AUS)
+        >>> batches = matcher.get_addresses_within_bounds(-26.66, -26.65,
+                                                          153.09, 153.10,
+                                                          regions="SA2")
+        >>> table = pyarrow.Table.from_batches(batches)
+        """
+        if min_latitude > max_latitude:
+            raise ValueError("The latitute range is invalid (lat_max >= lat_min)")
+
+        if min_longitude > max_longitude:
+            raise ValueError("The longitude range is invalid (long_max >= long_min)")
+
+        selected_columns = [
+            "FULL_ADDRESS",
+            "LATITUDE",
+            "LONGITUDE",
+        ] + self._get_region_columns(regions, operator)
+
+        scanner = self._scanner(
+            (min_latitude, max_latitude, min_longitude, max_longitude),
+            columns=self._get_file_columns(selected_columns),
+            filter=(ds.field("LATITUDE") >= min_latitude)
+            & (ds.field("LATITUDE") <= max_latitude)
+            & (ds.field("LONGITUDE") >= min_longitude)
+            & (ds.field("LONGITUDE") <= max_longitude),
+            batch_size=batch_size,
         )
 
-        distances, indices = ball_tree.query(
-            np.deg2rad(np.c_[lat, lon]), k=min(n, gnaf_df.shape[0])
+        for batch in scanner.to_batches():
+            if batch.num_rows == 0:
+                continue
+            if self._regions is None:
+                yield batch
+            else:
+                yield from self._join_regions(batch, selected_columns).to_batches()
+
+    def get_addresses_within(
+        self, lat, lon, km, regions=None, operator=None, batch_size=65536
+    ):
+        """
+        Stream all the addresses within a radius from the input coordinates
+        and their regions.
+
+        Parameters
+        ----------
+        lat:float
+            latitude
+        lon:float
+            longitude
+        km:float
+            the radius in kilometer
+        regions:string or list of string
+            Specify the name or list of names of the regions to be returned by the function
+        operator: Operator
+            use the operator (Operator.ge or Operator.le) to find all the 
+            upper/lower level regions from a particular region name.
+        batch_size:integer
+            the maximum number of addresses per batch (default = 65536)
+        
+        Returns
+        -------
+        Generator
+            the pyarrow RecordBatch of the addresses (FULL_ADDRESS, LATITUDE,
+            LONGITUDE, the selected regions and the DISTANCE in km).
+            The addresses are not sorted by the distance.
+        
+        Examples
+        --------
+        >>> matcher = GeoMatcher(AUS)
+        >>> for batch in matcher.get_addresses_within(-26.657299, 153.094955, 2,
+                                                      regions=["SA2", "LGA"]):
+        >>>     print(batch.num_rows)
+        """
+        if km <= 0:
+            raise ValueError("The radius has to be larger than 0")
+
+        # the box that covers the circle
+        distance = spatial.box_distance(lat, km / spatial.EARTH_RADIUS)
+
+        for batch in self.get_addresses_within_bounds(
+            lat - distance,
+            lat + distance,
+            lon - distance,
+            lon + distance,
+            regions=regions,
+            operator=operator,
+            batch_size=batch_size,
+        ):
+            distances = (
+                spatial.haversine(
+                    lat,
+                    lon,
+                    batch.column("LATITUDE").to_numpy(),
+                    batch.column("LONGITUDE").to_numpy(),
+                )
+                * spatial.EARTH_RADIUS
+            )
+            within = distances <= km
+            if within.any():
+                yield pa.RecordBatch.from_arrays(
+                    batch.filter(pa.array(within)).columns
+                    + [pa.array(distances[within])],
+                    names=batch.schema.names + ["DISTANCE"],
+                )
+
+    def explain_address(
+        self,
+        address,
+        similarity_threshold=0.9,
+        nlargest=1,
+        regions=None,
+        operator=None,
+        address_cleaning=False,
+        method=DistanceMethod.LEVENSHTEIN,
+    ):
+        """
+        Match the address and explain how it was matched: the parsed
+        components of the address, the index rows scored and the best
+        candidates, the address file and streets (IDX) read, the number
+        of rows decoded and scored, and the time of each stage.
+        It's used to tune the similarity threshold and the dataset layout
+        against the slow or unmatched addresses.
+
+        Parameters
+        ----------
+        address:string
+            The complete physical address
+        **kwargs:
+            The other parameters of get_region_by_address
+
+        Returns
+        -------
+        Dictionary
+            the plan of the matching and its result (under the "result" key)
+
+        Examples
+        --------
+        >>> matcher = GeoMatcher(AUS)
+        >>> plan = matcher.explain_address("2885 Darnley Street, Braybrookt, VIC 3019")
+        >>> plan["index"]["candidates"][0]
+        {'position': 90211, 'IDX': 1203, 'FILE_NAME': 'VIC-3.parquet',
+         'ADDRESS': 'DARNLEY STREET BRAYBROOK VIC 3019', 'RATIO': 0.9841}
+        >>> plan["reads"]
+        [{'file': 'VIC-3.parquet', 'idx': [1203], 'rows': 58}]
+        """
+        street_number, _ = self._split_street_number(address)
+        no_number_address = self._remove_street_number(address)
+        state_postcode = re.search(
+            r"\s((?:NSW|VIC|QLD|TAS|WA|SA|NT|ACT))\s([0-9]{4})$", no_number_address
         )
-        # Get indices of the search result, Extract pid and calculate distance(km)
-        indices = indices[0].tolist()
-        pids = gnaf_df.ADDRESS_DETAIL_PID.iloc[indices].tolist()
-        distance_map = dict(zip(pids, [distance * 6371 for distance in distances[0]]))
 
-        # 4. Filter the GNAF dataset by address_detail_pid
-        bool_list = gnaf_df["ADDRESS_DETAIL_PID"].isin(pids)
-        final_gnaf_df = gnaf_df[bool_list]
+        with stats.Trace() as trace:
+            result = self.get_region_by_address(
+                address,
+                similarity_threshold=similarity_threshold,
+                nlargest=nlargest,
+                regions=regions,
+                operator=operator,
+                address_cleaning=address_cleaning,
+                method=method,
+            )
+
+        index_lookup = trace.details.get("index_lookup", [{}])[0]
+        scoring = trace.details.get("address_scoring", [{}])[0]
+        reads = trace.details.get("parquet_read", [])
+        position = index_lookup.get("position")
+
+        return {
+            "address": address,
+            "components": {
+                "street_number": street_number.strip(),
+                "address": no_number_address,
+                "clean_address": index_lookup.get("address"),
+                "state": state_postcode.group(1) if state_postcode else None,
+                "postcode": state_postcode.group(2) if state_postcode else None,
+            },
+            "index": {
+                "exact": index_lookup.get("exact"),
+                "rows_scored": index_lookup.get("rows_scored", 0),
+                "matched": None
+                if position is None
+                else {
+                    "position": position,
+                    "IDX": self._index_data["IDX"].iat[position],
+                    "FILE_NAME": self._index_data["FILE_NAME"].iat[position],
+                    "ADDRESS": self._index_data["ADDRESS"].iat[position],
+                },
+                "candidates": index_lookup.get("candidates", []),
+            },
+            "reads": reads,
+            "rows_decoded": sum(read["rows"] for read in reads),
+            "rows_scored": scoring.get("rows_scored", 0),
+            "best_ratio": scoring.get("best_ratio"),
+            "stages": trace.stages,
+            "seconds": sum(stage["seconds"] for stage in trace.stages),
+            "result": result,
+        }
+
+    def explain_coordinates(
+        self,
+        lat,
+        lon,
+        n=1,
+        km=None,
+        regions=None,
+        operator=None,
+        mode=SearchMode.ADDRESS,
+    ):
+        """
+        Match the coordinates and explain how they were matched: how the
+        initial radius was chosen, the boxes (rings) loaded from the address
+        files, the number of radius doublings, the number of rows decoded
+        and the time of each stage. If the result is found in the cache,
+        no search is made and the plan only reports the cache hit.
+
+        Parameters
+        ----------
+        lat:float
+            latitude
+        lon:float
+            longitude
+        **kwargs:
+            The other parameters of get_region_by_coordinates
+
+        Returns
+        -------
+        Dictionary
+            the plan of the matching and its result (under the "result" key)
+
+        Examples
+        --------
+        >>> matcher = GeoMatcher(AUS)
+        >>> plan = matcher.explain_coordinates(-26.657299, 153.094955, n=100)
+        >>> plan["radius_doublings"], plan["loads"]
+        (1, [{'km': 0.2, 'inner_km': 0.0, 'rows': 64},
+             {'km': 0.4, 'inner_km': 0.2, 'rows': 157}])
+        """
+        with stats.Trace() as trace:
+            result = self.get_region_by_coordinates(
+                lat,
+                lon,
+                n=n,
+                km=km,
+                regions=regions,
+                operator=operator,
+                mode=mode,
+            )
 
-        final_gnaf_df.loc[:, "DISTANCE"] = final_gnaf_df["ADDRESS_DETAIL_PID"].map(
-            distance_map
+        loads = trace.details.get("parquet_load", [])
+        reads = trace.details.get("parquet_read", [])
+
+        return {
+            "coordinates": (lat, lon),
+            "mode": mode.name,
+            "cache": trace.details.get("cache", [None])[0],
+            "initial_radius": trace.details.get("initial_radius", [None])[0],
+            "radius_doublings": len(trace.details.get("radius_doubling", [])),
+            "radius_expansions": len(trace.details.get("radius_expansion", [])),
+            "loads": loads,
+            "reads": reads,
+            "rows_decoded": sum(load["rows"] for load in loads + reads),
+            "stages": trace.stages,
+            "seconds": sum(stage["seconds"] for stage in trace.stages),
+            "result": result,
+        }
+
+    async def _run_async(self, function, *args, **kwargs):
+        """
+        Run the matching function in the executor without blocking the
+        event loop, waiting for a free slot if max_concurrency is set.
+        If the call is cancelled before the function starts, the function
+        is not run.
+        """
+        loop = asyncio.get_running_loop()
+        call = partial(function, *args, **kwargs)
+
+        if self._max_concurrency is None:
+            return await loop.run_in_executor(self._executor, call)
+
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(
+                loop, asyncio.Semaphore(self._max_concurrency)
+            )
+
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, call)
+
+    async def aget_region_by_address(self, address, **kwargs):
+        """
+        The asyncio version of get_region_by_address. The matching runs
+        in the executor of the matcher.
+
+        Examples
+        --------
+        >>> matched = await matcher.aget_region_by_address(
+                "2885 Darnley Street, Braybrook, VIC 3019", regions="SA2")
+        """
+        return await self._run_async(self.get_region_by_address, address, **kwargs)
+
+    async def aget_regions_by_address(self, addresses, **kwargs):
+        """
+        The asyncio version of get_regions_by_address. The matching runs
+        in the executor of the matcher.
+        """
+        return await self._run_async(self.get_regions_by_address, addresses, **kwargs)
+
+    async def aget_region_by_coordinates(self, lat, lon, **kwargs):
+        """
+        The asyncio version of get_region_by_coordinates. The matching runs
+        in the executor of the matcher.
+
+        Examples
+        --------
+        >>> matched = await matcher.aget_region_by_coordinates(
+                -26.657299, 153.094955, n=3)
+        """
+        return await self._run_async(
+            self.get_region_by_coordinates, lat, lon, **kwargs
         )
 
-        return final_gnaf_df.sort_values("DISTANCE").to_dict(orient="list")
+    async def aget_regions_by_coordinates(self, coordinates, **kwargs):
+        """
+        The asyncio version of get_regions_by_coordinates. The matching runs
+        in the executor of the matcher.
+        """
+        return await self._run_async(
+            self.get_regions_by_coordinates, coordinates, **kwargs
+        )
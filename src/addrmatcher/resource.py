@@ -1,14 +1,33 @@
-from urllib import request
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib import error, parse, request
 import re
 import json
 import os
 import sys
+import time
+import hashlib
+import shutil
 from colorama import Fore, Style
 import argparse
 import signal
 
 CWD = os.path.abspath(os.getcwd())
 
+# the location of the data folders, the files of a country are in
+# [DATA_URL]/[country]/, listed by the manifest of the folder
+DATA_URL = "https://raw.githubusercontent.com/uts-mdsi-ilab2-synergy/addrmatcher/main/data"
+MANIFEST_FILE = "manifest.json"
+
+# the suffix of the files being downloaded
+PART_SUFFIX = ".part"
+
+# the directory of data/[country] in which the files are synced
+SYNC_DIR = ".sync"
+
+USER_AGENT = "Mozilla/5.0"
+CHUNK_SIZE = 1024 * 1024
+
 color_code = {
     "default": "",
     "red": Fore.RED,
@@ -86,13 +105,291 @@ def create_url(url):
     return api_url, download_dirs
 
 
-def download_data(country="Australia", output_dir=CWD):
-    """Download the files in directories and sub-directories in repo_url.
+def file_digest(filename, algorithm="sha256"):
+    """Compute the checksum of a file, reading it by chunks.
+
+    Parameters
+    ----------
+    filename : str
+        path of the file
+    algorithm : str
+        "sha256", or "git" for the SHA-1 of the Git blob (as listed by
+        the GitHub API)
+
+    Returns
+    -------
+    str
+        hexadecimal checksum
+
+    """
+    if algorithm == "git":
+        digest = hashlib.sha1(b"blob %d\0" % os.path.getsize(filename))
+    else:
+        digest = hashlib.new(algorithm)
+
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_file(filename, entry):
+    """Check the size and the checksum of a downloaded file against its manifest entry.
+
+    Parameters
+    ----------
+    filename : str
+        path of the file
+    entry : dict
+        manifest entry of the file, the "size", "sha256" and "git_sha"
+        keys are checked when present
+
+    Returns
+    -------
+    bool
+        whether the file matches the entry
+
+    """
+    if not os.path.isfile(filename):
+        return False
+    if entry.get("size") is not None and os.path.getsize(filename) != entry["size"]:
+        return False
+    if entry.get("sha256") and file_digest(filename) != entry["sha256"]:
+        return False
+    if entry.get("git_sha") and file_digest(filename, "git") != entry["git_sha"]:
+        return False
+    return True
+
+
+def create_manifest(folder):
+    """Write the manifest (name, size and SHA-256 of each file) of a data folder.
+
+    The manifest is published with the files, e.g. [base_url]/Australia/manifest.json,
+    so that the downloads can be verified.
+
+    Parameters
+    ----------
+    folder : str
+        data folder, example - data/Australia
+
+    Returns
+    -------
+    dict
+        the manifest
+
+    """
+    manifest = {
+        "files": [
+            {
+                "name": name,
+                "size": os.path.getsize(os.path.join(folder, name)),
+                "sha256": file_digest(os.path.join(folder, name)),
+            }
+            for name in sorted(os.listdir(folder))
+            if os.path.isfile(os.path.join(folder, name))
+            and name != MANIFEST_FILE
+            and not name.startswith(".")
+            and not name.endswith(PART_SUFFIX)
+        ]
+    }
+    with open(os.path.join(folder, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(country="Australia", base_url=DATA_URL, opener=None, timeout=60):
+    """Read the manifest of the data files of a country.
+
+    If the default location doesn't publish a manifest, the files are
+    listed with the GitHub API, which gives their size and Git checksum.
+    A ValueError is raised if a file name isn't a plain file name (e.g. ../x),
+    so that the files are only written into the data folder.
+
+    Parameters
+    ----------
+    country : str
+        country name, example - Australia
+    base_url : str
+        location of the data folders, the manifest is read from
+        [base_url]/[country]/manifest.json
+    opener : urllib.request.OpenerDirector
+        opener of the requests, a new one is built if it's None
+    timeout : float
+        timeout of the request in seconds
+
+    Returns
+    -------
+    list
+        manifest entries, with the "name", "url", "size" and checksum of each file
+
+    """
+    opener = opener or _build_opener()
+    folder_url = base_url.rstrip("/") + "/" + country
+
+    try:
+        with opener.open(folder_url + "/" + MANIFEST_FILE, timeout=timeout) as response:
+            files = json.load(response)["files"]
+    except error.HTTPError as e:
+        if e.code != 404 or base_url != DATA_URL:
+            raise
+
+        # list the files of the GitHub repository instead
+        api_url, _ = create_url(
+            "https://github.com/uts-mdsi-ilab2-synergy/addrmatcher/tree/main/data/"
+            + country
+            + "/"
+        )
+        with opener.open(api_url, timeout=timeout) as response:
+            files = [
+                {
+                    "name": file["name"],
+                    "url": file["download_url"],
+                    "size": file["size"],
+                    "git_sha": file["sha"],
+                }
+                for file in json.load(response)
+                if file["type"] == "file"
+            ]
+
+    for entry in files:
+        # the files are written into the data folder only
+        name = entry["name"]
+        if not isinstance(name, str) or name in ("", ".", "..") or (
+            os.path.basename(name) != name or "/" in name or "\\" in name
+        ):
+            raise ValueError(f"Invalid file name in the manifest: {name!r}")
+        entry.setdefault("url", folder_url + "/" + parse.quote(entry["name"]))
+    return files
+
+
+def download_file(
+    url, filename, entry=None, opener=None, retries=3, backoff=1.0, timeout=60
+):
+    """Download a file, resuming a partial download and verifying the result.
+
+    The file is downloaded into [filename].part and renamed once it's
+    complete and verified, so an interrupted download is resumed (with an
+    HTTP Range request) by the next call, and the file is never partially
+    written. A failed request or a corrupted file is retried, with
+    an exponential backoff.
+
+    Parameters
+    ----------
+    url : str
+        url of the file
+    filename : str
+        path of the downloaded file
+    entry : dict
+        manifest entry of the file, to verify its size and checksum
+    opener : urllib.request.OpenerDirector
+        opener of the requests, a new one is built if it's None
+    retries : int
+        number of retries after the first attempt
+    backoff : float
+        seconds to wait before the first retry, doubled for each retry
+    timeout : float
+        timeout of the requests in seconds
+
+    Returns
+    -------
+    int
+        number of bytes received
+
+    """
+    opener = opener or _build_opener()
+    entry = entry or {}
+    part = filename + PART_SUFFIX
+    received = 0
+
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+        try:
+            received += _fetch(opener, url, part, entry.get("size"), timeout)
+        except error.HTTPError as e:
+            # the missing files and the client errors aren't retried
+            if 400 <= e.code < 500 and e.code not in (408, 429) or attempt == retries:
+                raise
+            continue
+        except (error.URLError, HTTPException, OSError):
+            if attempt == retries:
+                raise
+            continue
+
+        size = entry.get("size")
+        if size is not None and os.path.getsize(part) < size:
+            # the connection was closed early, resume the download
+            continue
+
+        if verify_file(part, entry):
+            os.replace(part, filename)
+            return received
+
+        # corrupted, download the file again
+        os.remove(part)
+
+    raise OSError(f"The download is incomplete or corrupted: {url}")
+
+
+def _fetch(opener, url, part, size, timeout):
+    """Download the rest of the file into the partial file, return the number of bytes received"""
+    offset = os.path.getsize(part) if os.path.isfile(part) else 0
+    if size is not None and offset > size:
+        os.remove(part)
+        offset = 0
+    if size is not None and offset == size:
+        return 0
+
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    try:
+        response = opener.open(request.Request(url, headers=headers), timeout=timeout)
+    except error.HTTPError as e:
+        # the partial file is complete (or larger than the file), let it be verified
+        if e.code == 416 and offset > 0:
+            return 0
+        raise
+
+    received = 0
+    with response:
+        # the server ignores the range, download the whole file
+        mode = "ab" if offset > 0 and response.status == 206 else "wb"
+        with open(part, mode) as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                f.write(chunk)
+                received += len(chunk)
+    return received
+
+
+def _build_opener():
+    """Build the opener of the download requests"""
+    opener = request.build_opener()
+    opener.addheaders = [("User-agent", USER_AGENT)]
+    return opener
+
+
+def download_data(
+    country="Australia", output_dir=CWD, base_url=DATA_URL, workers=4, retries=3
+):
+    """Download the data files of a country, in parallel.
+
+    The files are listed by the manifest of the country (see read_manifest),
+    and each file is verified against its size and checksum. The partial
+    downloads of a previous run are resumed.
 
     Parameters
     ----------
     country : str
         country name which will be sub-directory name example - data/Australia/.
+    output_dir : str
+        directory in which the data/[country] directory is created
+    base_url : str
+        location of the data folders, the files are downloaded from
+        [base_url]/[country]/, e.g. a local HTTP server
+    workers : int
+        number of files downloaded at the same time
+    retries : int
+        number of retries of a failed download
 
     Returns
     -------
@@ -100,118 +397,205 @@ def download_data(country="Australia", output_dir=CWD):
         number of total files downloaded
 
     """
+    dir_out = os.path.join(output_dir, "data", country)
+    os.makedirs(dir_out, exist_ok=True)
 
-    # This is the temporary place to host of data files.
-    # Example - data/Australia/*.parquet
-    repo_url = (
-        "https://github.com/uts-mdsi-ilab2-synergy/addrmatcher/tree/main/data/"
-        + country
-        + "/"
-    )
+    # one opener for all the requests
+    opener = _build_opener()
+    files = read_manifest(country, base_url, opener)
+    _download_files(files, dir_out, opener, workers, retries)
 
-    # Generate the url which returns the JSON data
-    api_url, download_dirs = create_url(repo_url)
+    return len(files)
 
-    # Handle the directory path, Sync the path in Git and the path in local
-    if len(download_dirs.split(".")) == 0:
-        dir_out = os.path.join(output_dir, download_dirs)
-    else:
-        dir_out = os.path.join(output_dir, "/".join(download_dirs.split("/")[:-1]))
 
-    # Make a directory in the local with the name which is taken from the actual repo
-    os.makedirs(dir_out, exist_ok=True)
+def sync_data(
+    country="Australia",
+    output_dir=CWD,
+    base_url=DATA_URL,
+    workers=4,
+    retries=3,
+    prune=False,
+):
+    """Update the local data files of a country to the remote manifest.
 
-    # Open the URL
-    try:
-        opener = request.build_opener()
-        opener.addheaders = [("User-agent", "Mozilla/5.0")]
-        request.install_opener(opener)
-        response = request.urlretrieve(api_url)
-    except KeyboardInterrupt:
-        # when CTRL+C is pressed during the execution of this script,
-        # bring the cursor to the beginning,
-        # erase the current line, and dont make a new line
-        print_text("✘ Got interrupted", "red", in_place=True)
-        sys.exit()
+    Only the files whose size or checksum differ from the manifest are
+    downloaded, into the data/[country]/.sync directory. Once all of them
+    are downloaded and verified, they replace the local files (each with
+    an atomic rename), so the data files are never partially written.
 
-    # total files count
-    total_files = 0
-
-    # Writing into file
-    with open(response[0], "r") as f:
-        data = json.load(f)
-        # getting the total number of files so that we
-        # can use it for the output information later
-        total_files += len(data)
-
-        # If the data is a single file, download it as one.
-        if isinstance(data, dict) and data["type"] == "file":
-            try:
-                # download the file
-                opener = request.build_opener()
-                opener.addheaders = [("User-agent", "Mozilla/5.0")]
-                request.install_opener(opener)
-                request.urlretrieve(
-                    data["download_url"], os.path.join(dir_out, data["name"])
-                )
-                # bring the cursor to the beginning,
-                # erase the current line, and dont make a new line
-                print_text(
-                    "Downloaded: " + Fore.WHITE + "{}".format(data["name"]),
-                    "green",
-                    in_place=True,
-                )
-                return total_files
+    The local files which aren't in the manifest (e.g. the files built
+    locally) are only reported, unless prune is True.
+
+    The checksums of the local files are saved in data/[country]/manifest.json,
+    with the modification time of each file, so the files that didn't
+    change since the last sync aren't read again.
 
-            except KeyboardInterrupt:
-                # when CTRL+C is pressed during the execution of this script,
-                # bring the cursor to the beginning,
-                # erase the current line, and dont make a new line
-                print_text("✘ Got interrupted", "red", in_place=False)
-                sys.exit()
+    Parameters
+    ----------
+    country : str
+        country name which will be sub-directory name example - data/Australia/.
+    output_dir : str
+        directory in which the data/[country] directory is created
+    base_url : str
+        location of the data folders, the manifest and the files are read
+        from [base_url]/[country]/
+    workers : int
+        number of files downloaded at the same time
+    retries : int
+        number of retries of a failed download
+    prune : bool
+        whether to remove the local files which aren't in the manifest
 
-        # If Data is a directory which contains a list of file, not a single file
-        for file in data:
-            file_url = file["download_url"]
-            file_name = file["name"]
+    Returns
+    -------
+    dict
+        the names of the "added", "changed" and "removed" files, and of
+        the "extra" files (not in the manifest) which were kept
 
-            path = file["path"]
-            dirname = os.path.dirname(path)
+    """
+    dir_out = os.path.join(output_dir, "data", country)
+    dir_sync = os.path.join(dir_out, SYNC_DIR)
+    os.makedirs(dir_sync, exist_ok=True)
+
+    opener = _build_opener()
+    files = read_manifest(country, base_url, opener)
+    local = _read_local_manifest(dir_out)
+
+    changes = {"added": [], "changed": [], "removed": [], "extra": []}
+    outdated = []
+    for entry in files:
+        filename = os.path.join(dir_out, entry["name"])
+        if not os.path.isfile(filename):
+            changes["added"].append(entry["name"])
+        elif not _is_synced(filename, entry, local.get(entry["name"])):
+            changes["changed"].append(entry["name"])
+        else:
+            continue
+        outdated.append(entry)
+
+    # download everything before replacing any file, the files staged
+    # by an interrupted sync are kept
+    _download_files(
+        [
+            entry
+            for entry in outdated
+            if not verify_file(os.path.join(dir_sync, entry["name"]), entry)
+        ],
+        dir_sync,
+        opener,
+        workers,
+        retries,
+    )
+    for entry in outdated:
+        os.replace(
+            os.path.join(dir_sync, entry["name"]), os.path.join(dir_out, entry["name"])
+        )
 
-            if dirname != "":
-                os.makedirs(os.path.dirname(path), exist_ok=True)
+    names = {entry["name"] for entry in files}
+    for name in sorted(os.listdir(dir_out)):
+        filename = os.path.join(dir_out, name)
+        if (
+            name not in names
+            and name != MANIFEST_FILE
+            and not name.startswith(".")
+            and os.path.isfile(filename)
+        ):
+            if prune:
+                os.remove(filename)
+                changes["removed"].append(name)
             else:
-                pass
+                changes["extra"].append(name)
+
+    _write_local_manifest(dir_out, files)
+    shutil.rmtree(dir_sync, ignore_errors=True)
+
+    return changes
+
+
+def _is_synced(filename, entry, local_entry):
+    """Check whether the local file matches the manifest entry of the remote file"""
+    stat = os.stat(filename)
+    if entry.get("size") is not None and stat.st_size != entry["size"]:
+        return False
+
+    # the checksum saved by the last sync, if the file wasn't modified since
+    if (
+        local_entry is not None
+        and local_entry.get("size") == stat.st_size
+        and local_entry.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return all(
+            local_entry.get(key) == entry[key]
+            for key in ("sha256", "git_sha")
+            if entry.get(key)
+        )
+    return verify_file(filename, entry)
+
+
+def _read_local_manifest(folder):
+    """Read the manifest saved by the last sync, by the file name"""
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE)) as f:
+            return {entry["name"]: entry for entry in json.load(f)["files"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def _write_local_manifest(folder, files):
+    """Save the manifest of the synced files, with their modification time"""
+    entries = []
+    for entry in files:
+        stat = os.stat(os.path.join(folder, entry["name"]))
+        entry = {key: value for key, value in entry.items() if key != "url"}
+        entry["mtime_ns"] = stat.st_mtime_ns
+        entries.append(entry)
+
+    filename = os.path.join(folder, MANIFEST_FILE)
+    with open(filename + PART_SUFFIX, "w") as f:
+        json.dump({"files": entries}, f, indent=2)
+    os.replace(filename + PART_SUFFIX, filename)
+
+
+def _download_files(files, folder, opener, workers, retries):
+    """Download the manifest entries into the folder with a pool of threads, raise OSError if any failed"""
+
+    def download_entry(entry):
+        download_file(
+            entry["url"],
+            os.path.join(folder, entry["name"]),
+            entry,
+            opener=opener,
+            retries=retries,
+        )
+        # a single write, so that the lines of the threads aren't mixed
+        print_text(
+            "Downloaded " + Fore.WHITE + "{}\n".format(entry["name"]),
+            "green",
+            in_place=False,
+            end="",
+            flush=True,
+        )
 
-            if file_url is not None:
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(download_entry, entry): entry for entry in files}
+        try:
+            for future, entry in futures.items():
                 try:
-                    opener = request.build_opener()
-                    opener.addheaders = [("User-agent", "Mozilla/5.0")]
-                    request.install_opener(opener)
-                    # download the file
-                    request.urlretrieve(file_url, path)
-
-                    # bring the cursor to the beginning,
-                    # erase the current line, and dont make a new line
+                    future.result()
+                except (error.URLError, HTTPException, OSError) as e:
                     print_text(
-                        "Downloaded" + Fore.WHITE + "{}".format(file_name),
-                        "green",
-                        in_place=False,
-                        end="\n",
-                        flush=True,
+                        "✘ {}: {}".format(entry["name"], e), "red", in_place=False
                     )
+                    failed.append(entry["name"])
+        except KeyboardInterrupt:
+            # the files being downloaded are resumed by the next run
+            for future in futures:
+                future.cancel()
+            raise
 
-                except KeyboardInterrupt:
-                    # when CTRL+C is pressed during
-                    # the execution of this script,
-                    # bring the cursor to the beginning,
-                    # erase the current line, and dont make a new line
-                    print_text("✘ Got interrupted", "red", in_place=False)
-                    sys.exit()
-            else:
-                download_data(file["html_url"], dir_out)
-
-    return total_files
+    if failed:
+        raise OSError("Failed to download: {}".format(", ".join(failed)))
 
 
 def download():
@@ -232,14 +616,96 @@ def download():
         help="The country of data to which the matching "
         "will apply to. (Default is Australia if not specified)",
     )
-    parser.add_argument("country", help="the country of the address data to download")
+    parser.add_argument(
+        "country", nargs="?", help="the country of the address data to download"
+    )
+    parser.add_argument(
+        "--base-url",
+        default=DATA_URL,
+        help="The location of the data folders, e.g. a mirror or a local HTTP "
+        "server. (Default is the GitHub repository)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="The number of files downloaded at the same time. (Default is 4)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="The number of retries of a failed download. (Default is 3)",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Download only the files which differ from the manifest "
+        "(see --prune to remove the others)",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="With --sync, remove the local files which aren't in the manifest",
+    )
+    parser.add_argument(
+        "--create-manifest",
+        metavar="FOLDER",
+        help="Write the manifest of the data folder (e.g. data/Australia) "
+        "instead of downloading",
+    )
 
     args = parser.parse_args()
 
+    if args.create_manifest:
+        manifest = create_manifest(args.create_manifest)
+        print_text(
+            "✔ Manifest of {} files written".format(len(manifest["files"])),
+            "green",
+            in_place=False,
+        )
+        return
+
     # Make it "Australia" by default in the first release.
     country = "Australia" if args.country == "AUS".lower() else "Australia"
 
-    download_data(country)
+    try:
+        if args.sync:
+            changes = sync_data(
+                country,
+                base_url=args.base_url,
+                workers=args.workers,
+                retries=args.retries,
+                prune=args.prune,
+            )
+            print_text(
+                "✔ Sync complete: {} added, {} changed, {} removed".format(
+                    *(len(changes[key]) for key in ("added", "changed", "removed"))
+                ),
+                "green",
+                in_place=True,
+            )
+            if changes["extra"]:
+                print_text(
+                    "Not in the manifest (kept, use --prune to remove): {}".format(
+                        ", ".join(changes["extra"])
+                    ),
+                    in_place=False,
+                )
+            return
+
+        download_data(
+            country, base_url=args.base_url, workers=args.workers, retries=args.retries
+        )
+    except KeyboardInterrupt:
+        # when CTRL+C is pressed during the execution of this script,
+        # bring the cursor to the beginning,
+        # erase the current line, and dont make a new line
+        print_text("✘ Got interrupted", "red", in_place=False)
+        sys.exit()
+    except (OSError, ValueError) as e:
+        print_text("✘ {}".format(e), "red", in_place=False)
+        sys.exit(1)
     print_text("✔ Download complete", "green", in_place=True)
 
 
@@ -0,0 +1,193 @@
+"""
+Micro-batching of the concurrent address-based matching requests
+"""
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class MatchScheduler:
+    """
+    The MatchScheduler class coalesces the single address-based matching
+    requests, made concurrently from many threads, into batches.
+    The requests arriving within a small time window are matched with
+    a single call of GeoMatcher.get_regions_by_address, and the results
+    are handed back to the waiting callers.
+
+    Parameters
+    ----------
+    matcher: GeoMatcher
+        The matcher used to match the addresses
+    window: float
+        The time (in seconds) to wait for more requests after the first
+        request of a batch arrives (default = 0.002)
+    max_batch_size: integer
+        The maximum number of addresses per batch (default = 256)
+
+    Examples
+    --------
+    >>> matcher = GeoMatcher(AUS)
+    >>> with MatchScheduler(matcher) as scheduler:
+    >>>     matched = scheduler.get_region_by_address(
+                "2885 Darnley Street, Braybrook, VIC 3019")
+    """
+
+    __slots__ = (
+        "_matcher",
+        "_window",
+        "_max_batch_size",
+        "_requests",
+        "_worker",
+        "_closed",
+        "_lock",
+    )
+
+    def __init__(self, matcher, window=0.002, max_batch_size=256):
+        if window < 0:
+            raise ValueError("The time window can't be negative")
+
+        if max_batch_size < 1:
+            raise ValueError("The batch size must be at least 1")
+
+        self._matcher = matcher
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._requests = queue.Queue()
+
+        # no request is queued after the closing sentinel (None)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(
+            target=self._run, name="addrmatcher-scheduler", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, address, **kwargs):
+        """
+        Submit an address to be matched
+
+        Parameters
+        ----------
+        address:string
+            The complete physical address
+        **kwargs: dict, optional
+            The other arguments of GeoMatcher.get_region_by_address
+
+        Returns
+        -------
+        Future
+            The future of the dictionary returned by get_region_by_address
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The scheduler has been closed")
+            self._requests.put((address, kwargs, future))
+        return future
+
+    def get_region_by_address(self, address, **kwargs):
+        """
+        Match an address, the same way as GeoMatcher.get_region_by_address.
+        The call blocks until the batch containing the address is matched.
+        """
+        return self.submit(address, **kwargs).result()
+
+    def close(self):
+        """
+        Match the pending requests and stop the scheduler
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._requests.put(None)
+        self._worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        """
+        Collect the requests into batches and match them
+        """
+        closed = False
+        while not closed:
+            request = self._requests.get()
+            if request is None:
+                break
+
+            # wait for more requests within the time window
+            batch = [request]
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._max_batch_size:
+                try:
+                    request = self._requests.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except queue.Empty:
+                    break
+                if request is None:
+                    closed = True
+                    break
+                batch.append(request)
+
+            self._match(batch)
+
+        # the requests left behind the sentinel are never matched
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None and request[2].set_running_or_notify_cancel():
+                request[2].set_exception(RuntimeError("The scheduler has been closed"))
+
+    def _match(self, batch):
+        """
+        Match a batch of requests. The requests with the same arguments are
+        matched together. If a batch fails, its requests are matched one by
+        one, so that the error is only raised to the caller that caused it.
+        """
+        groups = {}
+        for address, kwargs, future in batch:
+            try:
+                key = tuple(
+                    sorted(
+                        (name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in kwargs.items()
+                    )
+                )
+                hash(key)
+            except TypeError:
+                # the arguments can't be grouped (e.g. a dictionary),
+                # the request is matched on its own
+                key = (id(future),)
+            groups.setdefault(key, (kwargs, []))[1].append((address, future))
+
+        for kwargs, requests in groups.values():
+            requests = [
+                (address, future)
+                for address, future in requests
+                if future.set_running_or_notify_cancel()
+            ]
+            if not requests:
+                continue
+
+            try:
+                results = self._matcher.get_regions_by_address(
+                    [address for address, _ in requests], **kwargs
+                )
+            except Exception:
+                for address, future in requests:
+                    try:
+                        future.set_result(
+                            self._matcher.get_region_by_address(address, **kwargs)
+                        )
+                    except Exception as error:
+                        future.set_exception(error)
+            else:
+                for (_, future), result in zip(requests, results):
+                    future.set_result(result)
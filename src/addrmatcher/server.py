@@ -0,0 +1,383 @@
+"""
+A local HTTP service that keeps a GeoMatcher loaded and serves the
+address-based and coordinate-based matching
+
+Endpoints
+---------
+GET  /health              the status of the service
+POST /address             {"address": "...", ...options}
+POST /coordinates         {"lat": ..., "lon": ..., ...options}
+POST /batch/address       {"addresses": [...], ...options}
+POST /batch/coordinates   {"coordinates": [[lat, lon], ...], ...options}
+
+The batch endpoints also accept an Arrow IPC stream (content type
+application/vnd.apache.arrow.stream) with an `address` column, or `lat` and
+`lon` columns. The options are then passed as query string parameters, and
+the response is an Arrow IPC stream with one row per matched address and
+an INPUT_INDEX column referring to the input row.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from operator import le, ge
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import math
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from .matcher import GeoMatcher, DistanceMethod, SearchMode
+from .scheduler import MatchScheduler
+from .hierarchies.AUS import AUS
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# the options of the matching functions and their converter from the request
+ADDRESS_OPTIONS = {
+    "similarity_threshold": float,
+    "nlargest": int,
+    "regions": lambda value: value,
+    "operator": lambda value: {"le": le, "ge": ge}[value],
+    "address_cleaning": lambda value: value in (True, "true", "True", "1"),
+    "method": lambda value: DistanceMethod[value.upper()],
+}
+COORDINATE_OPTIONS = {
+    "n": int,
+    "km": float,
+    "regions": lambda value: value,
+    "operator": lambda value: {"le": le, "ge": ge}[value],
+    "mode": lambda value: SearchMode[value.upper()],
+}
+
+
+def parse_options(values, options):
+    """
+    Convert the request parameters into the arguments of the matching function
+
+    Parameters
+    ----------
+    values : dict
+        the parameters of the request
+    options : dict
+        the converters of the accepted options
+
+    Returns
+    -------
+    dict
+        the keyword arguments of the matching function
+    """
+    kwargs = {}
+    for name, convert in options.items():
+        if name in values and values[name] is not None:
+            try:
+                kwargs[name] = convert(values[name])
+            except (KeyError, ValueError, TypeError, AttributeError):
+                raise ValueError(f"Invalid value of {name}: {values[name]}")
+    return kwargs
+
+
+def to_json(value):
+    """
+    Convert the result into JSON values, the missing values (NaN, NA and
+    NaT) become null
+
+    Parameters
+    ----------
+    value : object
+        the result of a matching function
+
+    Returns
+    -------
+    object
+        the result with the dictionaries, lists, strings, numbers, booleans
+        and None only
+    """
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if pd.isna(value):
+        return None
+    # numpy scalars
+    if hasattr(value, "item"):
+        return to_json(value.item())
+    return str(value)
+
+
+def to_arrow(results):
+    """
+    Flatten the list of matching results into an Arrow table,
+    with one row per matched address
+
+    Parameters
+    ----------
+    results : list
+        the list of dictionaries returned by the matching function
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    frames = [
+        pd.DataFrame(result).assign(INPUT_INDEX=position)
+        for position, result in enumerate(results)
+        if result
+    ]
+    if not frames:
+        return pa.table({"INPUT_INDEX": pa.array([], type=pa.int64())})
+
+    return pa.Table.from_pandas(pd.concat(frames, ignore_index=True), preserve_index=False)
+
+
+class MatchServer(ThreadingHTTPServer):
+    """
+    The HTTP server holding the GeoMatcher. At most max_concurrency requests
+    are matched at the same time. A request waiting longer than
+    queue_timeout seconds for its turn is rejected with 503 (Service
+    Unavailable) so that the clients can back off.
+
+    Parameters
+    ----------
+    address : tuple
+        the (host, port) to listen on
+    matcher : GeoMatcher
+        the matcher used to serve the requests
+    max_concurrency : int
+        the maximum number of requests matched at the same time
+    queue_timeout : float
+        the maximum time (in seconds) a request waits for its turn
+    batch_window : float
+        the time window to coalesce the single address requests
+        (see MatchScheduler). 0 disables the micro-batching
+    max_body_size : int
+        the maximum size of a request body in bytes
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        matcher,
+        max_concurrency=4,
+        queue_timeout=1.0,
+        batch_window=0.002,
+        max_body_size=16 * 1024 * 1024,
+    ):
+        super().__init__(address, MatchRequestHandler)
+        self.matcher = matcher
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.max_body_size = max_body_size
+        self.scheduler = MatchScheduler(matcher, batch_window) if batch_window > 0 else None
+
+    def server_close(self):
+        super().server_close()
+        if self.scheduler is not None:
+            self.scheduler.close()
+
+
+class MatchRequestHandler(BaseHTTPRequestHandler):
+    """
+    The handler of the matching requests, see the module's documentation
+    for the endpoints
+    """
+
+    server_version = "addrmatcher"
+
+    def log_message(self, format, *args):
+        # keep the console quiet, the errors are returned to the clients
+        pass
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        endpoints = {
+            "/address": self._match_address,
+            "/coordinates": self._match_coordinates,
+            "/batch/address": self._match_addresses,
+            "/batch/coordinates": self._match_coordinates_batch,
+        }
+        if url.path not in endpoints:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        # the body isn't read when the request is rejected here,
+        # so the connection can't be reused
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self.close_connection = True
+            self._send_json(411, {"error": "The Content-Length header is required"})
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send_json(400, {"error": "The Content-Length header is invalid"})
+            return
+        if length > self.server.max_body_size:
+            self.close_connection = True
+            self._send_json(413, {"error": "The request body is too large"})
+            return
+        body = self.rfile.read(length)
+
+        # backpressure: reject the request if it can't be served in time
+        if not self.server.slots.acquire(timeout=self.server.queue_timeout):
+            self._send_json(
+                503, {"error": "The server is busy"}, headers={"Retry-After": "1"}
+            )
+            return
+
+        try:
+            is_arrow = self.headers.get("Content-Type", "").startswith(ARROW_STREAM)
+            if is_arrow:
+                values = {
+                    name: value[0] if len(value) == 1 else value
+                    for name, value in parse_qs(url.query).items()
+                }
+                table = pa.ipc.open_stream(body).read_all()
+            else:
+                values = json.loads(body or b"{}")
+                table = None
+                if not isinstance(values, dict):
+                    raise ValueError("The request body must be a JSON object")
+
+            status, result = 200, endpoints[url.path](values, table)
+        except (ValueError, KeyError, TypeError, pa.ArrowInvalid) as error:
+            status, result, is_arrow = 400, {"error": str(error)}, False
+        except Exception as error:
+            status, result, is_arrow = 500, {"error": str(error)}, False
+        finally:
+            self.server.slots.release()
+
+        if is_arrow:
+            self._send_arrow(status, to_arrow(result))
+        else:
+            self._send_json(status, result)
+
+    def _match_address(self, values, table):
+        kwargs = parse_options(values, ADDRESS_OPTIONS)
+        if not isinstance(values.get("address"), str):
+            raise ValueError("The address must be a string")
+
+        if self.server.scheduler is not None:
+            return self.server.scheduler.get_region_by_address(values["address"], **kwargs)
+        return self.server.matcher.get_region_by_address(values["address"], **kwargs)
+
+    def _match_coordinates(self, values, table):
+        kwargs = parse_options(values, COORDINATE_OPTIONS)
+        return self.server.matcher.get_region_by_coordinates(
+            float(values["lat"]), float(values["lon"]), **kwargs
+        )
+
+    def _match_addresses(self, values, table):
+        kwargs = parse_options(values, ADDRESS_OPTIONS)
+        addresses = (
+            table.column("address").to_pylist()
+            if table is not None
+            else values["addresses"]
+        )
+        return self.server.matcher.get_regions_by_address(addresses, **kwargs)
+
+    def _match_coordinates_batch(self, values, table):
+        kwargs = parse_options(values, COORDINATE_OPTIONS)
+        if table is not None:
+            coordinates = list(
+                zip(table.column("lat").to_pylist(), table.column("lon").to_pylist())
+            )
+        else:
+            coordinates = values["coordinates"]
+        return self.server.matcher.get_regions_by_coordinates(coordinates, **kwargs)
+
+    def _send_json(self, status, result, headers=None):
+        # a missed NaN fails loudly instead of sending invalid JSON
+        body = json.dumps(to_json(result), allow_nan=False).encode()
+        self._send(status, "application/json", body, headers)
+
+    def _send_arrow(self, status, table):
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        self._send(status, ARROW_STREAM, sink.getvalue().to_pybytes())
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    """Start the matching service, reading the arguments from user's command line interface."""
+
+    parser = argparse.ArgumentParser(
+        description="Serve the address and coordinate matching over local HTTP"
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="The host to listen on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port", "-p", type=int, default=8080, help="The port to listen on (default: 8080)"
+    )
+    parser.add_argument(
+        "--data",
+        default="",
+        help="The folder of the reference dataset (default: data/[country])",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=4,
+        help="The maximum number of requests matched at the same time (default: 4)",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=1.0,
+        help="The seconds a request waits for its turn before 503 is returned (default: 1)",
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=0.002,
+        help="The seconds to coalesce the single address requests, 0 to disable (default: 0.002)",
+    )
+
+    args = parser.parse_args()
+
+    # Australia is the only country in the first release
+    matcher = GeoMatcher(AUS, args.data)
+    server = MatchServer(
+        (args.host, args.port),
+        matcher,
+        max_concurrency=args.max_concurrency,
+        queue_timeout=args.queue_timeout,
+        batch_window=args.batch_window,
+    )
+
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
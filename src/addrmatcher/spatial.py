@@ -0,0 +1,341 @@
+"""
+Spherical geometry helpers for the coordinate-based matching
+"""
+import math
+import numpy as np
+
+# the mean radius of the earth in km
+EARTH_RADIUS = 6371
+
+
+def haversine(lat, lon, latitudes, longitudes):
+    """
+    Calculate the great-circle distance between a point and a list of points
+
+    Parameters
+    ----------
+    lat:float
+        latitude of the reference point (in degrees)
+    lon:float
+        longitude of the reference point (in degrees)
+    latitudes:array-like
+        latitudes of the other points (in degrees)
+    longitudes:array-like
+        longitudes of the other points (in degrees)
+
+    Returns
+    -------
+    numpy array
+        the distances in radians (multiply by EARTH_RADIUS to get km)
+    """
+    lat, lon = np.deg2rad(lat), np.deg2rad(lon)
+    latitudes = np.deg2rad(np.asarray(latitudes, dtype=float))
+    longitudes = np.deg2rad(np.asarray(longitudes, dtype=float))
+
+    a = (
+        np.sin((latitudes - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(latitudes) * np.sin((longitudes - lon) / 2) ** 2
+    )
+    return 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def ball_tree(latitudes, longitudes):
+    """
+    Build the Ball tree of the coordinates with the haversine metric.
+    scikit-learn is imported on the first use, as it's slow to import
+
+    Parameters
+    ----------
+    latitudes:array
+        the latitudes in degrees
+    longitudes:array
+        the longitudes in degrees
+
+    Returns
+    -------
+    BallTree
+        the tree of the coordinates in radians
+    """
+    from sklearn.neighbors import BallTree
+
+    return BallTree(np.deg2rad(np.c_[latitudes, longitudes]), metric="haversine")
+
+
+def covered_radius(lat, distance):
+    """
+    Return the radius of the largest circle around a point that lies
+    within a box of +/- distance degrees of latitude and longitude
+
+    Any address closer to the point than this radius is guaranteed to be
+    in the box. The latitude sides are `distance` away along the meridian,
+    while the longitude sides are meridians and get closer towards the poles.
+
+    Parameters
+    ----------
+    lat:float
+        latitude of the centre of the box (in degrees)
+    distance:float
+        half width of the box (in degrees)
+
+    Returns
+    -------
+    float
+        the radius in radians
+    """
+    half_width = math.radians(min(distance, 90))
+    to_meridian = math.asin(
+        min(1.0, math.cos(math.radians(lat)) * math.sin(half_width))
+    )
+    return min(half_width, to_meridian)
+
+
+def box_distance(lat, radius):
+    """
+    Return the half width (in degrees) of the smallest box around a point
+    whose covered radius is at least `radius`. The inverse of covered_radius.
+
+    Parameters
+    ----------
+    lat:float
+        latitude of the centre of the box (in degrees)
+    radius:float
+        the radius to be covered (in radians)
+
+    Returns
+    -------
+    float
+        the half width of the box in degrees
+    """
+    cos_lat = math.cos(math.radians(lat))
+    if radius >= math.pi / 2 or math.sin(radius) >= cos_lat:
+        return 90.0
+
+    return math.degrees(max(radius, math.asin(math.sin(radius) / cos_lat)))
+
+
+class DensityGrid:
+    """
+    A coarse grid of address counts used to estimate how many addresses
+    are located within a box, before reading any address file.
+
+    The counts are stored as a summed-area table, so that the estimate for
+    any box only needs four lookups. Addresses are assumed to be uniformly
+    distributed within a cell.
+
+    Parameters
+    ----------
+    counts: 2d array
+        The number of addresses per cell. The rows are the latitude cells
+        and the columns are the longitude cells
+    min_latitude: float
+        The latitude of the lower edge of the first row of cells
+    min_longitude: float
+        The longitude of the left edge of the first column of cells
+    cell_size: float
+        The width and height of a cell (in degrees)
+    """
+
+    __slots__ = ("_table", "_min_latitude", "_min_longitude", "_cell_size")
+
+    def __init__(self, counts, min_latitude, min_longitude, cell_size):
+        counts = np.asarray(counts, dtype=np.float64)
+        self._table = np.zeros((counts.shape[0] + 1, counts.shape[1] + 1))
+        self._table[1:, 1:] = counts.cumsum(axis=0).cumsum(axis=1)
+        self._min_latitude = min_latitude
+        self._min_longitude = min_longitude
+        self._cell_size = cell_size
+
+    @classmethod
+    def from_points(cls, latitudes, longitudes, cell_size=0.1):
+        """
+        Create the grid by counting the addresses per cell
+
+        Parameters
+        ----------
+        latitudes:array-like
+            latitudes of the addresses
+        longitudes:array-like
+            longitudes of the addresses
+        cell_size:float
+            The width and height of a cell in degrees (default = 0.1)
+
+        Returns
+        -------
+        DensityGrid
+        """
+        rows = np.floor(np.asarray(latitudes) / cell_size).astype(np.int64)
+        cols = np.floor(np.asarray(longitudes) / cell_size).astype(np.int64)
+        return cls.from_cells(rows, cols, np.ones(len(rows)), cell_size)
+
+    @classmethod
+    def from_cells(cls, rows, cols, counts, cell_size):
+        """
+        Create the grid from the sparse list of non empty cells.
+        A cell (row, col) covers the latitudes [row * cell_size, (row + 1) * cell_size)
+        and the longitudes [col * cell_size, (col + 1) * cell_size)
+        """
+        rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+        if len(rows) == 0:
+            return cls(np.zeros((1, 1)), 0.0, 0.0, cell_size)
+
+        grid = np.zeros((rows.max() - rows.min() + 1, cols.max() - cols.min() + 1))
+        np.add.at(grid, (rows - rows.min(), cols - cols.min()), counts)
+        return cls(grid, rows.min() * cell_size, cols.min() * cell_size, cell_size)
+
+    @property
+    def cell_size(self):
+        """
+        Return the width and height of a cell (in degrees)
+        """
+        return self._cell_size
+
+    def to_cells(self):
+        """
+        Return the sparse list of non empty cells as (rows, cols, counts)
+        """
+        counts = np.diff(np.diff(self._table, axis=0), axis=1)
+        rows, cols = np.nonzero(counts)
+        return (
+            rows + int(round(self._min_latitude / self._cell_size)),
+            cols + int(round(self._min_longitude / self._cell_size)),
+            counts[rows, cols],
+        )
+
+    def _cumulative(self, lat, lon):
+        # bilinear interpolation of the summed-area table at the coordinates
+        last_row, last_col = self._table.shape[0] - 1, self._table.shape[1] - 1
+        row = min(max((lat - self._min_latitude) / self._cell_size, 0), last_row)
+        col = min(max((lon - self._min_longitude) / self._cell_size, 0), last_col)
+        row_0, col_0 = min(int(row), last_row - 1), min(int(col), last_col - 1)
+        row_fraction, col_fraction = row - row_0, col - col_0
+
+        table = self._table
+        return (
+            table[row_0, col_0] * (1 - row_fraction) * (1 - col_fraction)
+            + table[row_0 + 1, col_0] * row_fraction * (1 - col_fraction)
+            + table[row_0, col_0 + 1] * (1 - row_fraction) * col_fraction
+            + table[row_0 + 1, col_0 + 1] * row_fraction * col_fraction
+        )
+
+    def count(self, min_latitude, max_latitude, min_longitude, max_longitude):
+        """
+        Estimate the number of addresses within a box
+
+        Returns
+        -------
+        float
+            the estimated number of addresses
+        """
+        return (
+            self._cumulative(max_latitude, max_longitude)
+            - self._cumulative(min_latitude, max_longitude)
+            - self._cumulative(max_latitude, min_longitude)
+            + self._cumulative(min_latitude, min_longitude)
+        )
+
+    def distance_for(self, lat, lon, n, min_distance=0.0005, max_distance=90.0):
+        """
+        Estimate the half width (in degrees) of the box around a point
+        that contains about n addresses.
+
+        The target count is raised by the ratio between the box and its
+        inscribed circle, so that the n nearest addresses are expected to
+        be found within the circle covered by the box.
+
+        Parameters
+        ----------
+        lat:float
+            latitude
+        lon:float
+            longitude
+        n:integer
+            the expected number of addresses
+        min_distance:float
+            the smallest half width to be returned (default = 0.0005, about 50 meters)
+        max_distance:float
+            the largest half width to be returned (default = 90)
+
+        Returns
+        -------
+        float
+            the half width of the box in degrees
+        """
+        target = n * 4 / math.pi
+
+        def box_count(distance):
+            return self.count(lat - distance, lat + distance, lon - distance, lon + distance)
+
+        if box_count(max_distance) < target:
+            return max_distance
+
+        low, high = min_distance, max_distance
+        if box_count(low) >= target:
+            return low
+
+        # binary search until the box is within 1% of the smallest fitting one
+        while high - low > low * 0.01:
+            middle = (low + high) / 2
+            if box_count(middle) >= target:
+                high = middle
+            else:
+                low = middle
+
+        return high
+
+
+def hilbert_index(latitudes, longitudes, boundary, order=16):
+    """
+    Return the position of the coordinates along a Hilbert curve covering
+    the boundary. Coordinates that are close to each other tend to have
+    close positions, so sorting the coordinates by their position groups
+    the nearby coordinates together.
+
+    Parameters
+    ----------
+    latitudes:array-like
+        latitudes of the points
+    longitudes:array-like
+        longitudes of the points
+    boundary:list
+        [minimum latitude, maximum latitude, minimum longitude, maximum longitude]
+    order:integer
+        the curve covers a grid of 2^order x 2^order cells (default = 16)
+
+    Returns
+    -------
+    numpy array
+        the positions of the points along the curve
+
+    Examples
+    --------
+    >>> hilbert_index([-33.86, -37.81, -33.87], [151.20, 144.96, 151.21],
+                      AUS.coordinate_boundary)
+    """
+    size = 1 << order
+    min_latitude, max_latitude, min_longitude, max_longitude = boundary
+
+    # map the coordinates to the cells of the grid
+    y = (np.asarray(latitudes, dtype=float) - min_latitude) / max(
+        max_latitude - min_latitude, 1e-12
+    )
+    x = (np.asarray(longitudes, dtype=float) - min_longitude) / max(
+        max_longitude - min_longitude, 1e-12
+    )
+    x = np.clip((x * size).astype(np.int64), 0, size - 1)
+    y = np.clip((y * size).astype(np.int64), 0, size - 1)
+
+    index = np.zeros(x.shape, dtype=np.int64)
+    s = size >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += s * s * ((3 * rx) ^ ry)
+
+        # rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, size - 1 - x, x)
+        y = np.where(flip, size - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+
+    return index
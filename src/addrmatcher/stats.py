@@ -0,0 +1,170 @@
+"""
+Timing instrumentation and tracing of the matching stages
+"""
+import contextvars
+import threading
+import time
+
+# the trace of the matching call running in the current context, if any
+_current_trace = contextvars.ContextVar("addrmatcher_trace", default=None)
+
+
+class Stage:
+    """
+    The Stage class measures the wall time of a matching stage and reports
+    it, with the number of rows processed by the stage, to the callback.
+
+    Parameters
+    ----------
+    callback: callable
+        The function called with (stage name, seconds, rows) when the
+        stage ends. If it's empty (None), nothing is measured
+    name: string
+        The name of the stage
+
+    Examples
+    --------
+    >>> with Stage(print, "parquet_read") as stage:
+    >>>     table = pq.read_table(filename)
+    >>>     stage.rows = table.num_rows
+    parquet_read 0.0123 4134
+    """
+
+    __slots__ = ("_callback", "_trace", "_start", "name", "rows")
+
+    def __init__(self, callback, name):
+        self._callback = callback
+        self._trace = _current_trace.get()
+        self._start = 0.0
+        self.name = name
+        self.rows = 0
+
+    def __enter__(self):
+        if self._callback is not None or self._trace is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        if self._callback is None and self._trace is None:
+            return
+
+        seconds = time.perf_counter() - self._start
+        if self._callback is not None:
+            self._callback(self.name, seconds, self.rows)
+        if self._trace is not None:
+            self._trace.stages.append(
+                {"stage": self.name, "seconds": seconds, "rows": self.rows}
+            )
+
+
+class StageStats:
+    """
+    The StageStats class aggregates the number of calls, the wall time and
+    the number of rows of each matching stage. The instance can be used as
+    the instrument callback of GeoMatcher.
+
+    Examples
+    --------
+    >>> stats = StageStats()
+    >>> matcher = GeoMatcher(AUS, instrument=stats)
+    >>> matcher.get_region_by_address("2885 Darnley Street, Braybrook, VIC 3019")
+    >>> stats.summary()["index_scoring"]
+    {'calls': 1, 'seconds': 0.3478, 'rows': 715092}
+    """
+
+    __slots__ = ("_stages", "_lock")
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, seconds, rows):
+        with self._lock:
+            totals = self._stages.setdefault(
+                stage, {"calls": 0, "seconds": 0.0, "rows": 0}
+            )
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["rows"] += rows
+
+    def summary(self):
+        """
+        Return the totals of each stage
+
+        Returns
+        -------
+        dictionary
+            the number of calls, the wall time (seconds) and the number of rows,
+            by the stage name
+        """
+        with self._lock:
+            return {stage: dict(totals) for stage, totals in self._stages.items()}
+
+    def reset(self):
+        """
+        Remove all the recorded stages
+        """
+        with self._lock:
+            self._stages.clear()
+
+    def __str__(self):
+        lines = [f"{'stage':<24}{'calls':>8}{'seconds':>12}{'rows':>12}"]
+        for stage, totals in self.summary().items():
+            lines.append(
+                f"{stage:<24}{totals['calls']:>8}"
+                f"{totals['seconds']:>12.4f}{totals['rows']:>12}"
+            )
+        return "\n".join(lines)
+
+
+class Trace:
+    """
+    The Trace class records what a matching call did: the stages it ran
+    (see Stage) and the details reported with record(), e.g. the files read.
+    The stages and the details are recorded while the trace is active,
+    in the current thread (or asyncio task) only.
+
+    Examples
+    --------
+    >>> with Trace() as trace:
+    >>>     matcher.get_region_by_coordinates(-26.657299, 153.094955)
+    >>> trace.details["parquet_load"]
+    [{'km': 0.575, 'inner_km': 0.0, 'rows': 112}]
+    """
+
+    __slots__ = ("stages", "details", "_token")
+
+    def __init__(self):
+        self.stages = []
+        self.details = {}
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_trace.set(self)
+        return self
+
+    def __exit__(self, *args):
+        _current_trace.reset(self._token)
+
+
+def current_trace():
+    """
+    Return the active trace of the current context, or None if not traced
+    """
+    return _current_trace.get()
+
+
+def record(name, value):
+    """
+    Append the value to the details of the active trace (if any)
+
+    Parameters
+    ----------
+    name: string
+        The name of the detail, e.g. parquet_read
+    value: object
+        The value to be appended
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.details.setdefault(name, []).append(value)
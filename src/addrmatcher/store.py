@@ -0,0 +1,430 @@
+"""
+The memory-mapped Arrow IPC (Feather) copy of the reference dataset
+
+Usage: addrmatcher-convert --input data/Australia --output data/Australia-arrow
+                           [--compression lz4] [--batch-size 65536]
+
+The address files are converted into Arrow IPC files (uncompressed by
+default, or LZ4), sorted by IDX and split into record batches of the same
+size. The range of IDX, LATITUDE and LONGITUDE of each batch is saved into
+the metadata of the file. The index and the other auxiliary files are
+copied (the file names in the index are updated).
+
+GeoMatcher uses the Arrow files when the dataset folder contains them.
+They are memory mapped: the addresses of a street (IDX) are sliced out of
+the batches without copying them, only the batches overlapping the search
+box are scanned, and the pages of the files are shared by all the processes
+using the dataset through the page cache of the OS. An LZ4 file is smaller,
+but the batches read are decompressed (into the memory of the process).
+"""
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from . import dataset
+
+ARROW_EXTENSION = ".arrow"
+
+# the number of rows of a record batch
+BATCH_SIZE = 65536
+
+# the key of the file metadata storing the value range of each batch
+STATS_KEY = b"addrmatcher.batches"
+STATS_COLUMNS = ["IDX", "LATITUDE", "LONGITUDE"]
+
+
+def write_address_file(table, filename, compression=None, batch_size=BATCH_SIZE):
+    """
+    Write the addresses into an Arrow IPC file, sorted by IDX, with the
+    value range of each batch in the metadata
+
+    Parameters
+    ----------
+    table:pyarrow.Table
+        The addresses
+    filename:string
+        The path of the Arrow file
+    compression:string
+        The compression of the buffers, "lz4" or None (uncompressed)
+    batch_size:integer
+        The number of rows of a record batch
+
+    Returns
+    -------
+    integer
+        The number of batches written
+    """
+    if batch_size < 1:
+        raise ValueError("The batch size must be at least 1")
+
+    # the sort is stable, the addresses of a street keep their order
+    if len(table) > 1 and not pc.all(
+        pc.greater_equal(table["IDX"][1:], table["IDX"][:-1])
+    ).as_py():
+        table = table.take(pc.sort_indices(table["IDX"]))
+    table = table.combine_chunks()
+
+    batches = [
+        table.slice(offset, batch_size).to_batches()[0]
+        for offset in range(0, len(table), batch_size)
+    ]
+    stats = {column: [] for column in STATS_COLUMNS}
+    for batch in batches:
+        for column in STATS_COLUMNS:
+            bounds = pc.min_max(batch.column(column))
+            stats[column].append([bounds["min"].as_py(), bounds["max"].as_py()])
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[STATS_KEY] = json.dumps(stats).encode()
+    schema = table.schema.with_metadata(metadata)
+
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.ipc.new_file(filename, schema, options=options) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+    return len(batches)
+
+
+def convert_dataset(file_location, output, compression=None, batch_size=BATCH_SIZE):
+    """
+    Convert the address files of the dataset into Arrow IPC files and copy
+    the auxiliary files, with the file names of the index updated
+
+    Parameters
+    ----------
+    file_location:string
+        The folder of the dataset, e.g. data/Australia
+    output:string
+        The folder of the Arrow dataset, e.g. data/Australia-arrow
+    compression:string
+        The compression of the Arrow files, "lz4" or None (uncompressed)
+    batch_size:integer
+        The number of rows of a record batch
+
+    Returns
+    -------
+    list
+        The names of the Arrow files
+
+    Examples
+    --------
+    >>> convert_dataset("data/Australia", "data/Australia-arrow")
+    >>> matcher = GeoMatcher(AUS, "data/Australia-arrow")
+    """
+    if os.path.abspath(file_location) == os.path.abspath(output):
+        raise ValueError("The Arrow dataset must be written into another folder")
+    if not os.path.isfile(os.path.join(file_location, dataset.INDEX_FILE)):
+        raise ValueError(
+            f"Index file ({dataset.INDEX_FILE}) can't be found in: {file_location}"
+        )
+
+    os.makedirs(output, exist_ok=True)
+
+    # the Arrow files of a previous conversion
+    for filename in dataset.get_address_files(output, ARROW_EXTENSION):
+        os.remove(filename)
+
+    names = []
+    for filename in dataset.get_address_files(file_location):
+        name = os.path.splitext(os.path.basename(filename))[0] + ARROW_EXTENSION
+        write_address_file(
+            pq.read_table(filename), os.path.join(output, name), compression, batch_size
+        )
+        names.append(name)
+
+    # the index refers to the Arrow files
+    index = pq.read_table(os.path.join(file_location, dataset.INDEX_FILE))
+    position = index.schema.get_field_index("FILE_NAME")
+    index = index.set_column(
+        position,
+        "FILE_NAME",
+        pc.replace_substring_regex(
+            index["FILE_NAME"].cast(pa.string()), r"\.parquet$", ARROW_EXTENSION
+        ),
+    )
+    pq.write_table(index, os.path.join(output, dataset.INDEX_FILE))
+
+    for name in dataset.AUXILIARY_FILES:
+        if name != dataset.INDEX_FILE and os.path.isfile(
+            os.path.join(file_location, name)
+        ):
+            shutil.copyfile(os.path.join(file_location, name), os.path.join(output, name))
+
+    return names
+
+
+class ArrowFile:
+    """
+    The ArrowFile class reads an Arrow IPC address file written by
+    write_address_file through a memory map
+
+    Parameters
+    ----------
+    filename: string
+        The path of the Arrow file
+    """
+
+    __slots__ = ("_reader", "_stats", "schema")
+
+    def __init__(self, filename):
+        self._reader = pa.ipc.open_file(pa.memory_map(filename))
+
+        metadata = dict(self._reader.schema.metadata or {})
+        if STATS_KEY not in metadata:
+            raise ValueError(
+                f"The Arrow file wasn't converted by addrmatcher-convert: {filename}"
+            )
+
+        # the value ranges of the batches, with the missing ranges (batches
+        # of null values) never overlapping
+        stats = json.loads(metadata.pop(STATS_KEY))
+        self._stats = {
+            column: np.array(
+                [
+                    bounds if None not in bounds else [np.inf, -np.inf]
+                    for bounds in stats[column]
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 2)
+            for column in STATS_COLUMNS
+        }
+        self.schema = self._reader.schema.with_metadata(metadata)
+
+    @property
+    def physical_schema(self):
+        """
+        Return the schema of the file (as the fragments of pyarrow.dataset)
+        """
+        return self.schema
+
+    @property
+    def num_batches(self):
+        """
+        Return the number of record batches of the file
+        """
+        return self._reader.num_record_batches
+
+    def read_streets(self, streets, columns=None):
+        """
+        Read the addresses of the streets. Only the batches containing the
+        streets are read and the rows of each street are sliced out of them,
+        without copy if the file isn't compressed
+
+        Parameters
+        ----------
+        streets:list
+            The IDX of the streets
+        columns:list
+            The columns to be read. If it's empty (None), read all columns
+
+        Returns
+        -------
+        pyarrow.Table
+            The addresses, in the order of the file
+        """
+        streets = np.unique(np.asarray(streets, dtype=np.int64))
+        stats = self._stats["IDX"]
+        starts = np.searchsorted(streets, stats[:, 0], "left")
+        ends = np.searchsorted(streets, stats[:, 1], "right")
+
+        slices = []
+        for batch_number in np.flatnonzero(ends > starts):
+            batch = self._reader.get_batch(int(batch_number))
+            values = batch.column("IDX").to_numpy(zero_copy_only=False)
+            batch_streets = streets[starts[batch_number] : ends[batch_number]]
+            lower = np.searchsorted(values, batch_streets, "left")
+            upper = np.searchsorted(values, batch_streets, "right")
+
+            # merge the slices of the consecutive streets
+            position = None
+            for start, end in zip(lower, upper):
+                if end == start:
+                    continue
+                if position is None:
+                    position = (start, end)
+                elif start == position[1]:
+                    position = (position[0], end)
+                else:
+                    slices.append(batch.slice(position[0], position[1] - position[0]))
+                    position = (start, end)
+            if position is not None:
+                slices.append(batch.slice(position[0], position[1] - position[0]))
+
+        table = pa.Table.from_batches(slices, schema=self.schema)
+        return table if columns is None else table.select(columns)
+
+    def get_batches(self, min_latitude, max_latitude, min_longitude, max_longitude):
+        """
+        Return the batches whose coordinates overlap the box
+
+        Parameters
+        ----------
+        min_latitude:float
+            The minimum latitude of the box
+        max_latitude:float
+            The maximum latitude of the box
+        min_longitude:float
+            The minimum longitude of the box
+        max_longitude:float
+            The maximum longitude of the box
+
+        Returns
+        -------
+        list
+            The record batches
+        """
+        latitudes, longitudes = self._stats["LATITUDE"], self._stats["LONGITUDE"]
+        overlaps = (
+            (latitudes[:, 0] <= max_latitude)
+            & (latitudes[:, 1] >= min_latitude)
+            & (longitudes[:, 0] <= max_longitude)
+            & (longitudes[:, 1] >= min_longitude)
+        )
+        return [
+            self._reader.get_batch(int(batch_number))
+            for batch_number in np.flatnonzero(overlaps)
+        ]
+
+
+class ArrowStore:
+    """
+    The ArrowStore class reads the addresses of the Arrow IPC files of a
+    dataset converted by convert_dataset, see ArrowFile
+
+    Parameters
+    ----------
+    filenames: list
+        The paths of the Arrow files
+
+    Examples
+    --------
+    >>> store = ArrowStore(dataset.get_address_files("data/Australia-arrow", ".arrow"))
+    >>> store.read_streets("VIC-3.arrow", [1203], ["FULL_ADDRESS", "IDX"])
+    """
+
+    __slots__ = ("files", "schema")
+
+    def __init__(self, filenames):
+        self.files = {
+            os.path.basename(filename): ArrowFile(filename) for filename in filenames
+        }
+
+        # the schema of the first file is the schema of the dataset
+        # (as pyarrow.dataset)
+        self.schema = (
+            next(iter(self.files.values())).schema if self.files else pa.schema([])
+        )
+
+    def read_streets(self, filename, streets, columns=None):
+        """
+        Read the addresses of the streets from a file, see ArrowFile.read_streets
+
+        Parameters
+        ----------
+        filename:string
+            The name of the file, e.g. VIC-3.arrow
+        streets:list
+            The IDX of the streets
+        columns:list
+            The columns to be read. If it's empty (None), read all columns
+
+        Returns
+        -------
+        pyarrow.Table
+            The addresses
+        """
+        return self.files[filename].read_streets(streets, columns)
+
+    def scanner(
+        self,
+        min_latitude,
+        max_latitude,
+        min_longitude,
+        max_longitude,
+        columns=None,
+        filter=None,
+        **kwargs,
+    ):
+        """
+        Return the scanner of the batches overlapping the box
+
+        Parameters
+        ----------
+        min_latitude:float
+            The minimum latitude of the box
+        max_latitude:float
+            The maximum latitude of the box
+        min_longitude:float
+            The minimum longitude of the box
+        max_longitude:float
+            The maximum longitude of the box
+        columns:list
+            The columns to be read. If it's empty (None), read all columns
+        filter:pyarrow.dataset.Expression
+            The filter of the rows, e.g. the box of the coordinates
+        **kwargs: dict, optional
+            The other options of pyarrow.dataset.Scanner, e.g. batch_size
+
+        Returns
+        -------
+        pyarrow.dataset.Scanner
+            The scanner of the batches
+        """
+        batches = [
+            batch
+            for file in self.files.values()
+            for batch in file.get_batches(
+                min_latitude, max_latitude, min_longitude, max_longitude
+            )
+        ]
+        return ds.dataset(batches, schema=self.schema).scanner(
+            columns=columns, filter=filter, **kwargs
+        )
+
+
+def main():
+    """
+    Convert the dataset into the Arrow IPC files (addrmatcher-convert)
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert the reference dataset into memory-mapped Arrow IPC files"
+    )
+    parser.add_argument(
+        "--input", default="data/Australia", help="The folder of the dataset"
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="The folder of the Arrow dataset, e.g. data/Australia-arrow",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["none", "lz4"],
+        default="none",
+        help="The compression of the Arrow files (default = none)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"The number of rows of a record batch (default = {BATCH_SIZE})",
+    )
+    args = parser.parse_args()
+
+    names = convert_dataset(
+        args.input,
+        args.output,
+        compression=None if args.compression == "none" else args.compression,
+        batch_size=args.batch_size,
+    )
+    print(f"Converted {len(names)} address files into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
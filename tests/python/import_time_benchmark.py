@@ -0,0 +1,74 @@
+"""
+Measure the time to import the package and make sure the heavy
+dependencies aren't imported until they are used.
+
+Usage: python import_time_benchmark.py [--repeat 5] [--limit 0.3]
+
+Each statement runs in a new interpreter. The script exits with an error
+if the median time of `import addrmatcher` is above the limit (seconds),
+or if importing the package loads one of the heavy modules.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# the statements to be measured, from the lightest to the heaviest
+STATEMENTS = [
+    "import addrmatcher",
+    "from addrmatcher import AUS",
+    "from addrmatcher import download",
+    "from addrmatcher import GeoMatcher",
+]
+
+# the modules that must not be imported by `import addrmatcher`
+HEAVY_MODULES = ["pandas", "pyarrow", "sklearn", "rapidfuzz"]
+
+
+def measure(statement):
+    """Return the wall time (seconds) of the statement in a new interpreter"""
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"{statement}\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def imported_heavy_modules():
+    """Return the heavy modules loaded by `import addrmatcher`"""
+    code = (
+        "import sys, addrmatcher\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return [module for module in output.strip().split(",") if module]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=float, default=0.3)
+    args = parser.parse_args()
+
+    results = {}
+    for statement in STATEMENTS:
+        times = [measure(statement) for _ in range(args.repeat)]
+        results[statement] = statistics.median(times)
+        print(f"{statement:<40}{results[statement]:>10.3f} s")
+
+    heavy_modules = imported_heavy_modules()
+    if heavy_modules:
+        sys.exit(f"`import addrmatcher` imports the heavy modules: {heavy_modules}")
+
+    if results["import addrmatcher"] > args.limit:
+        sys.exit(
+            f"`import addrmatcher` takes {results['import addrmatcher']:.3f} s, "
+            f"more than {args.limit} s"
+        )
@@ -0,0 +1,77 @@
+"""
+Check that MatchScheduler resolves every request of a batch, including the
+requests with arguments that can't be grouped, and keeps working after them.
+
+Usage: python scheduler_check.py
+
+The matcher is a stand-in recording the batches, so no dataset is needed.
+The script exits with an error if a check fails.
+"""
+import sys
+import threading
+
+from addrmatcher import MatchScheduler
+
+
+class RecordingMatcher:
+    """A stand-in of GeoMatcher returning the upper case addresses"""
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def get_regions_by_address(self, addresses, **kwargs):
+        if any(isinstance(value, dict) for value in kwargs.values()):
+            raise TypeError("Invalid regions")
+        with self.lock:
+            self.batches.append(list(addresses))
+        return [{"FULL_ADDRESS": [address.upper()]} for address in addresses]
+
+    def get_region_by_address(self, address, **kwargs):
+        return self.get_regions_by_address([address], **kwargs)[0]
+
+
+def check(condition, message):
+    if not condition:
+        sys.exit(message)
+
+
+if __name__ == "__main__":
+    matcher = RecordingMatcher()
+
+    # a long window, so that all the requests are in the same batch
+    scheduler = MatchScheduler(matcher, window=0.5)
+    good = [scheduler.submit(f"{number} smith street") for number in range(3)]
+    bad = scheduler.submit("1 bad street", regions={"SA2": 1})
+    good.append(scheduler.submit("4 smith street", regions=["SA2"]))
+
+    for number, future in enumerate(good):
+        check(
+            future.result(timeout=5)["FULL_ADDRESS"][0].endswith("SMITH STREET"),
+            f"The good request {number} wasn't matched",
+        )
+    check(
+        isinstance(bad.exception(timeout=5), TypeError),
+        "The error of the bad request wasn't raised to its caller",
+    )
+    check(
+        ["0 smith street", "1 smith street", "2 smith street"] in matcher.batches,
+        "The requests with the same arguments weren't matched together",
+    )
+
+    # the scheduler keeps matching after the bad request
+    later = scheduler.submit("5 smith street")
+    check(
+        later.result(timeout=5) == {"FULL_ADDRESS": ["5 SMITH STREET"]},
+        "The scheduler stopped after the bad request",
+    )
+
+    scheduler.close()
+    try:
+        scheduler.submit("6 smith street")
+    except RuntimeError:
+        pass
+    else:
+        sys.exit("The closed scheduler accepted a request")
+
+    print("ok")